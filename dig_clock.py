@@ -28,14 +28,18 @@ class DigitalClock():
         self.pos.setSize(size)
         
     def animate(self, win):
-                 
-            
+        # tick on absolute one second deadlines so the clock does not drift
+        self.tick()
+        self.scheduler = Scheduler(win, self.tick, 1000)
+        self.scheduler.start(1000)
+
+    def tick(self):
+        
         self.secs4 = converter().convert_toseconds(self.time2)
         self.secs4 += 1
         self.time2 = converter().convert_toclock(self.secs4)
         self.display = converter().ampmformat(self.time2)
         self.pos.setText(self.display)
-        win.after(1000, self.animate, win)
     
         
 class converter():
@@ -1,6 +1,10 @@
 from graphics import *
 
-import random
+import numpy as np
+
+from life_engine import NumpyEngine, SparseEngine, CycleDetector, SimulationThread
+from life_patterns import load_pattern
+from life_checkpoint import CheckpointWriter, restore_checkpoint
 
     
 
@@ -8,6 +12,8 @@ BLOCK_SIZE = 40
 BLOCK_OUTLINE_WIDTH = 2
 BOARD_WIDTH = 25
 BOARD_HEIGHT = 25
+# largest width and height in pixels of the view of an image board
+VIEW_SIZE = 800
 
 
 
@@ -52,20 +58,24 @@ class Block(Rectangle):
 
     def set_live(self, canvas):
         '''
-        Sets the block status to 'live' and draws it on the grid.
+        Sets the block status to 'live' and shows it on the grid.
         Be sure to do this on the canvas!
         '''
         if self.status=='dead':
           self.status = 'live'
-          self.draw(canvas)
+          if self.id is None:
+              self.draw(canvas)
+          else:
+              self.canvas_frame.configItem(self.id, {'state': 'normal'})
 
     def set_dead(self):
         '''
-        Sets the block status to 'dead' and undraws it from the grid.
+        Sets the block status to 'dead' and hides it on the grid.
         '''
         if self.status=='live':
           self.status = 'dead'
-          self.undraw()
+          if self.id is not None:
+              self.canvas_frame.configItem(self.id, {'state': 'hidden'})
 
     def is_live(self):
         '''
@@ -83,7 +93,190 @@ class Block(Rectangle):
             self.set_dead()
         elif self.new_status=='live':
             self.set_live(canvas)
-            
+
+
+class BlockRenderer(object):
+    ''' BlockRenderer class: draws the engine state with the blocks of a Board
+        Every block is drawn once and afterwards only shown or hidden.
+        Only the blocks whose status flipped between two generations are
+        touched, and all their canvas changes are sent to Tk in one
+        CanvasFrame batch, so the cost of a redraw follows the number of changes, not the area.
+        Attributes: board - type:Board - the board whose blocks are drawn
+    '''
+
+    def __init__(self, board):
+        self.board = board
+
+    def render(self, prev, next):
+        '''
+        Takes two engine snapshots and updates the blocks of every
+        square that changed between them. Returns the (born, died) lists
+        of squares from the engine.
+        '''
+        born, died = self.board.engine.changed_cells(prev, next)
+        block_list = self.board.block_list
+        shown = []
+        hidden = []
+        for coord in born:
+            block = block_list.get(coord)
+            if block is not None and block.status == 'dead':
+                block.status = 'live'
+                shown.append(block.id)
+        for coord in died:
+            block = block_list.get(coord)
+            if block is not None and block.status == 'live':
+                block.status = 'dead'
+                hidden.append(block.id)
+        with self.board.canvas.batch():
+            self.set_state(shown, 'normal')
+            self.set_state(hidden, 'hidden')
+        return born, died
+
+    def set_state(self, ids, state):
+        '''
+        Sets the Tk state of all the canvas items in ids in one batch,
+        instead of one itemconfig call per item.
+        '''
+        frame = self.board.canvas
+        with frame.batch():
+            for id in ids:
+                frame.configItem(id, {'state': state})
+
+
+class ImageRenderer(object):
+    ''' ImageRenderer class: draws the engine state as one image
+        Instead of a canvas item for every square, each frame is built
+        with NumPy and written into a single Pixmap with one bulk put,
+        shown on the canvas through an Image. The cost of a frame follows
+        the number of pixels in the view, not the number of squares, so
+        boards of millions of squares stay interactive.
+        The view can be zoomed and panned, from code or with the keys:
+        the arrow keys pan, + and - zoom in and out.
+        Attributes: board - type:Board - the board that is drawn
+                    pixmap - type:Pixmap - the frame, as large as the canvas
+                    image - type:Image - shows the pixmap on the canvas
+                    zoom - type:float - pixels per square; below 1, one
+                    pixel shows 1/zoom x 1/zoom squares and is live if
+                    any of them is
+                    view_x, view_y - type:int - the square at the top left
+                    of the view
+                    colors - type:numpy.ndarray - rgb values of the dead
+                    squares, the live squares and the grid lines
+    '''
+
+    # grid lines are drawn from this many pixels per square up
+    GRID_ZOOM = 4
+
+    def __init__(self, board, zoom=None):
+        self.board = board
+        self.width = board.canvas.getWidth()
+        self.height = board.canvas.getHeight()
+        self.pixmap = Pixmap(self.width, self.height)
+        self.image = Image(Point(self.width // 2, self.height // 2), self.pixmap)
+        self.image.draw(board.canvas)
+        if zoom is None:
+            zoom = min(self.fit_zoom(board.width, self.width),
+                       self.fit_zoom(board.height, self.height))
+        self.zoom = zoom
+        self.view_x = 0
+        self.view_y = 0
+        self.colors = np.array([[255, 255, 255], [0, 0, 255], [0, 0, 0]],
+                               dtype=np.uint8)
+        # set to False if Tk cannot read PPM data; row strings are slower
+        self.use_ppm = True
+
+    def fit_zoom(self, squares, pixels):
+        '''
+        Returns the largest zoom, up to BLOCK_SIZE pixels per square, at
+        which the given number of squares fits in the given pixels.
+        '''
+        if squares <= pixels:
+            return max(1, min(BLOCK_SIZE, pixels // max(squares, 1)))
+        return 1.0 / (-(-squares // pixels))
+
+    def render(self, prev, next):
+        '''
+        Takes two engine snapshots and draws the second one. Returns the
+        (born, died) lists of squares from the engine.
+        '''
+        changes = self.board.engine.changed_cells(prev, next)
+        self.draw(next)
+        return changes
+
+    def draw(self, snapshot):
+        '''
+        Draws the view of an engine snapshot into the pixmap.
+        '''
+        engine = self.board.engine
+        if self.zoom >= 1:
+            zoom = int(self.zoom)
+            area = engine.region(snapshot, self.view_x, self.view_y,
+                                 -(-self.width // zoom), -(-self.height // zoom))
+            pixels = area.repeat(zoom, axis=0).repeat(zoom, axis=1)
+            pixels = pixels[:self.height, :self.width]
+            if zoom >= self.GRID_ZOOM:
+                # a line along the last pixel of every square, under the
+                # live squares like the grid lines of the block board
+                for lines in (pixels[zoom - 1::zoom, :], pixels[:, zoom - 1::zoom]):
+                    lines[lines == 0] = 2
+        else:
+            pixels = engine.region(snapshot, self.view_x, self.view_y,
+                                   self.width, self.height,
+                                   int(round(1 / self.zoom)))
+        rgb = self.colors[pixels]
+        if self.use_ppm:
+            header = ('P6 %d %d 255\n' % (self.width, self.height)).encode('ascii')
+            try:
+                self.pixmap.putPPM(header + rgb.tobytes())
+                return
+            except tk.TclError:
+                self.use_ppm = False
+        names = ['#%02x%02x%02x' % tuple(color) for color in self.colors.tolist()]
+        self.pixmap.putRows([[names[value] for value in row]
+                             for row in pixels.tolist()])
+
+    def pan(self, dx, dy):
+        '''
+        Moves the view by dx, dy squares and redraws it.
+        '''
+        self.view_x += dx
+        self.view_y += dy
+        self.draw(self.board.shown)
+
+    def set_zoom(self, zoom):
+        '''
+        Sets the zoom, keeping the square in the middle of the view in
+        the middle, and redraws the view.
+        '''
+        centre_x = self.view_x + self.width / 2.0 / self.zoom
+        centre_y = self.view_y + self.height / 2.0 / self.zoom
+        self.zoom = zoom
+        self.view_x = int(centre_x - self.width / 2.0 / zoom)
+        self.view_y = int(centre_y - self.height / 2.0 / zoom)
+        self.draw(self.board.shown)
+
+    def key_pressed(self, event):
+        '''
+        Pans with the arrow keys, a tenth of the view at a time, and zooms
+        in and out by a factor of 2 with + and -.
+        '''
+        step_x = max(1, int(self.width / self.zoom / 10))
+        step_y = max(1, int(self.height / self.zoom / 10))
+        moves = {'Left': (-step_x, 0), 'Right': (step_x, 0),
+                 'Up': (0, -step_y), 'Down': (0, step_y)}
+        if event.keysym in moves:
+            self.pan(*moves[event.keysym])
+        elif event.keysym in ('plus', 'equal', 'KP_Add'):
+            if self.zoom >= 1:
+                self.set_zoom(min(int(self.zoom) * 2, BLOCK_SIZE))
+            else:
+                self.set_zoom(1.0 / max(1, int(round(1 / self.zoom)) // 2))
+        elif event.keysym in ('minus', 'KP_Subtract'):
+            if self.zoom > 1:
+                self.set_zoom(int(self.zoom) // 2)
+            else:
+                self.set_zoom(1.0 / (int(round(1 / self.zoom)) * 2))
+
 
 class Board(object):
     ''' Board class: it represents the Game of Life board
@@ -91,19 +284,89 @@ class Board(object):
                     height - type:int - height of the board in squares
                     canvas - type:CanvasFrame - where the blocks will be drawn
                     block_list - type:Dictionary - stores the blocks for a given position
+                    engine - type:LifeEngine - holds the board state and
+                    computes the generations; the blocks only display it
+                    boundary - type:string - 'bounded', 'toroidal' (the
+                    edges wrap around) or 'infinite' (the board goes on past
+                    the edges of the canvas)
+                    neighbor_table - type:Dictionary - (x,y):list of the
+                    neighbouring blocks, filled in as get_block_neighbors
+                    is asked for them
+                    rule - type:Rule - the Life-like rule, e.g. 'B3/S23'
+                    (Conway's), 'highlife' or 'B3678/S34678'
+                    detector - type:CycleDetector - recognizes when the board
+                    has settled, see settled()
+                    on_settle - type:string - what animate does once the
+                    board has settled: None (keep going), 'stop' or 'slow'
+                    settle_delay - type:int - ms between simulations once
+                    settled, when on_settle is 'slow'
+                    render_delay - type:int - ms between redraws while
+                    animating (None: redraw after every simulation)
+                    scheduler - type:Scheduler - runs animate's timestep
+                    and counts missed deadlines
+                    background - type:bool - if True, animate computes the
+                    generations on a worker thread and only draws the
+                    newest one every render_delay ms
+                    simulation - type:SimulationThread - the worker thread
+                    while animating in the background, otherwise None
+                    checkpoint_every - type:int - simulate writes a
+                    checkpoint every this many generations (None: never)
+                    checkpoint_path - type:string - file the checkpoints
+                    are written to
+                    checkpoints - type:CheckpointWriter - writes the
+                    checkpoints in the background
+                    renderer - type:BlockRenderer or ImageRenderer - draws
+                    the board: 'blocks' gives a canvas item per square,
+                    'image' a single zoomable image for large boards
     '''
 
-    def __init__(self, win, width, height):
+    def __init__(self, win, width, height, engine=None, boundary='bounded',
+                 rule='B3/S23', renderer='blocks'):
         self.width = width
         self.height = height
         self.win = win
+        if engine is None:
+            if boundary == 'infinite':
+                engine = SparseEngine(width, height, boundary, rule)
+            else:
+                engine = NumpyEngine(width, height, boundary, rule)
+        self.engine = engine
+        self.boundary = engine.boundary
+        self.rule = engine.rule
         # self.delay is the number of ms between each simulation.
         self.delay = 1000
+        self.render_delay = None
+        self.scheduler = Scheduler(win, self.simulate, self.delay)
+        self.background = False
+        self.simulation = None
+        self.detector = CycleDetector()
+        self.on_settle = None
+        self.settle_delay = 10000
+        self.checkpoint_every = None
+        self.checkpoint_path = 'life.ckpt'
+        self.checkpoints = CheckpointWriter()
+
+        if renderer == 'image':
+            # one image for the whole board instead of a canvas item per
+            # square; there are no blocks
+            self.canvas = CanvasFrame(win, min(self.width * BLOCK_SIZE, VIEW_SIZE),
+                                      min(self.height * BLOCK_SIZE, VIEW_SIZE))
+            self.block_list = {}
+            self.neighbor_table = {}
+            self.renderer = ImageRenderer(self)
+            self.win.bind_all('<Key>', self.renderer.key_pressed)
+            self.shown = self.engine.snapshot()
+            self.redraw()
+            return
+
         # create a canvas to draw the blocks on
         self.canvas = CanvasFrame(win, self.width * BLOCK_SIZE,
                                        self.height * BLOCK_SIZE)
         self.canvas.setBackground('white')
 
+        # everything up to the first redraw is created in one batch
+        self.canvas.beginBatch()
+
         # initialize grid lines
         for x in range(1,self.width):
             self.draw_gridline(Point(x, 0), Point(x, self.height))
@@ -116,11 +379,24 @@ class Board(object):
         # key:value pairs of (x,y):Block
         self.block_list = {}
         y = 0
-        while y < BOARD_HEIGHT:  
-            for x in range(BOARD_WIDTH):  
+        while y < self.height:
+            for x in range(self.width):
                 self.block_list[(x,y)] = Block(Point(x,y),'blue')
             y += 1            
 
+        self.neighbor_table = {}
+
+        # Every block is drawn once up front and hidden; from then on the
+        # renderer only shows and hides the blocks that change.
+        self.renderer = BlockRenderer(self)
+        for block in self.block_list.values():
+            block.draw(self.canvas)
+        self.renderer.set_state([block.id for block in self.block_list.values()],
+                                'hidden')
+        self.canvas.endBatch()
+        self.shown = self.engine.snapshot()
+        self.redraw()
+        self.canvas.setMouseHandler(self.clicked)
 
 
     def draw_gridline(self, startp, endp):
@@ -144,9 +420,9 @@ class Board(object):
                                      blocks
             This method activates the specified percentage of blocks randomly.
         '''
-        for block in self.block_list.values():
-            if random.random() < percentage:
-                block.set_live(self.canvas)
+        self.engine.random_seed(percentage)
+        self.redraw()
+        self.detector.reset(self.engine.live_cells(), self.engine.generation)
 
     def seed(self, block_coords):
         '''
@@ -155,58 +431,237 @@ class Board(object):
         and activates the blocks corresponding to those coordinates.
         '''
 
-        for coord in block_coords:
-            if coord in self.block_list.keys():
-                self.block_list[coord].set_live(self.canvas)
+        self.engine.seed(block_coords)
+        self.redraw()
+        self.detector.reset(self.engine.live_cells(), self.engine.generation)
+
+    def load_pattern(self, filename, x=0, y=0):
+        ''' Parameters: filename - type:string - an .rle or .cells file
+                        x, y - type:int - where the top left of the pattern goes
+            Return value: type: dictionary - the header of the file
+
+            Seeds the board with a pattern file, streaming it straight into
+            the engine. The board keeps its own rule; compare it with the
+            'rule' of the returned header.
+        '''
+        header = load_pattern(filename, self.engine, x, y)
+        self.redraw()
+        self.detector.reset(self.engine.live_cells(), self.engine.generation)
+        return header
+
+    def toggle(self, x, y):
+        ''' Parameters: x, y - type:int - a square of the board
+
+            Flips the square between live and dead and redraws the board.
+            While a background simulation runs, the engine belongs to its
+            thread, so the flip is sent to it and drawn by show_latest.
+        '''
+        if self.simulation is not None:
+            self.simulation.edit(lambda engine: self._flip(x, y))
+            return
+        self._flip(x, y)
+        self.redraw()
+
+    def _flip(self, x, y):
+        # runs on the SimulationThread when animating in the background
+        if self.engine.is_live(x, y):
+            self.engine.set_dead(x, y)
+        else:
+            self.engine.set_live(x, y)
+        self.detector.reset(self.engine.live_cells(), self.engine.generation)
+        return self.settled()
+
+    def clicked(self, point):
+        ''' Parameters: point - type:Point - where the canvas was clicked
+
+            Mouse handler: toggles the square under the mouse. The block
+            is found with the canvas's spatial index, so the cost of a
+            click does not grow with the size of the board.
+        '''
+        for obj in self.canvas.findAt(point.x, point.y):
+            if isinstance(obj, Block):
+                self.toggle(*obj.get_coords())
+                return
+
+    def redraw(self):
+        '''
+        Updates the blocks from the generation currently on the screen
+        to the current generation of the engine, and returns the
+        (born, died) lists of squares that changed.
+        '''
+
+        current = self.engine.snapshot()
+        changes = self.renderer.render(self.shown, current)
+        self.shown = current
+        return changes
 
     def get_block_neighbors(self, block):
         '''
         Given a Block object, returns a list of neighboring blocks.
         Should not return itself in the list.
+        The list is cached in neighbor_table and must not be modified.
         '''
 
-        neighbors = []
         coords = block.get_coords()
-        y = -1
-        while y < 2:   
-            for x in range(-1,2):
-                if 0 <= (coords[0] + x) <= BOARD_WIDTH - 1 and 0 <= (coords[1] + y) <= BOARD_HEIGHT - 1:
-                    neighbors.append(self.block_list[coords[0] + x, coords[1] + y])
-            y += 1
-        neighbors.remove(self.block_list[coords[0], coords[1]])  
+        neighbors = self.neighbor_table.get(coords)
+        if neighbors is None:
+            neighbors = self.neighbor_table[coords] = self.find_block_neighbors(coords)
+        return neighbors
+
+    def find_block_neighbors(self, coords):
+        '''
+        Given (x, y) coordinates, works out the list of neighboring blocks
+        for the board's boundary. get_block_neighbors caches the result.
+        On a toroidal board the neighbors past an edge are the blocks on
+        the opposite edge; otherwise there are no blocks past the edges.
+        '''
+
+        neighbors = []
+        for y in range(coords[1] - 1, coords[1] + 2):
+            for x in range(coords[0] - 1, coords[0] + 2):
+                if self.boundary == 'toroidal':
+                    neighbor = (x % self.width, y % self.height)
+                else:
+                    neighbor = (x, y)
+                if neighbor != coords and neighbor in self.block_list:
+                    neighbors.append(self.block_list[neighbor])
         return neighbors
 
     def simulate(self):
         '''
-        Executes one turn of Conways Game of Life 
+        Executes one turn of Conways Game of Life (or of the board's rule)
         '''
 
-        for block in self.block_list.values():
-            neighbors = self.get_block_neighbors(block)
-            alive = 0
-            for neighbor in neighbors:
-                if neighbor.is_live() == True:
-                    alive += 1
-            if alive < 2:
-                block.new_status = 'dead'
-            elif alive == 2 and block.status == 'live':
-                block.new_status = 'live'
-            elif alive == 3:
-                block.new_status = 'live'
-            elif alive > 3:
-                block.new_status = 'dead'
-                
-        for block in self.block_list.values():
-            block.reset_status(self.canvas)
+        self.engine.step()
+        born, died = self.redraw()
+        self._after_generation(born, died)
+
+    def advance(self):
+        '''
+        Executes one turn like simulate, but without redrawing the board;
+        call redraw to show it.
+        '''
+        prev = self.engine.snapshot()
+        self.engine.step()
+        born, died = self.engine.changed_cells(prev, self.engine.snapshot())
+        self._after_generation(born, died)
+
+    def _record_generation(self, born, died):
+        # runs on the SimulationThread when animating in the background,
+        # so it must not touch Tk or the scheduler; the settled state it
+        # returns goes to show_latest with the frame
+        self.detector.update(born, died, self.engine.generation)
+        if (self.checkpoint_every
+                and self.engine.generation % self.checkpoint_every == 0):
+            self.checkpoint()
+        return self.settled()
+
+    def _after_generation(self, born, died):
+        self._record_generation(born, died)
+        # while animating, stop or slow down once the board has settled
+        if self.settled() is None or not self.scheduler.running:
+            return
+        if self.on_settle == 'stop':
+            self.scheduler.stop()
+        elif self.on_settle == 'slow':
+            self.scheduler.setPeriod(max(self.delay, self.settle_delay))
+
+    def checkpoint(self, path=None):
+        '''
+        Writes a checkpoint of the board to path (default: checkpoint_path)
+        in the background. See life_checkpoint.
+        '''
+        self.checkpoints.write(path or self.checkpoint_path, self.engine)
+
+    def resume(self, path=None):
+        '''
+        Replaces the board with the checkpoint at path (default:
+        checkpoint_path), including its generation number. The checkpoint
+        must be for the board's rule.
+        '''
+        restore_checkpoint(path or self.checkpoint_path, self.engine)
+        self.redraw()
+        self.detector.reset(self.engine.live_cells(), self.engine.generation)
+
+    def settled(self):
+        '''
+        Returns a (kind, period) tuple once the board has settled into
+        'extinct', a 'still' life or an 'oscillator', otherwise None.
+        '''
+        if self.detector.kind is None:
+            return None
+        return self.detector.kind, self.detector.period
 
 
     def animate(self):
         '''
-        Animates the Game of Life, calling "simulate"
-        once every second
+        Animates the Game of Life, calling "simulate" every delay ms on
+        absolute deadlines, so the time a generation takes does not add
+        to the period. If render_delay is set, generations are computed
+        every delay ms and drawn every render_delay ms. If background is
+        set, the generations are computed on a SimulationThread and the
+        Tk main loop only draws the newest one, so a slow generation does
+        not freeze the window. Once the board has settled it stops or
+        slows down, depending on on_settle. Missed deadlines are counted
+        by self.scheduler. Animating again first stops the animation
+        that is running, including its SimulationThread.
+        '''
+        scheduler = self.scheduler
+        if self.simulation is not None:
+            self.stop()
+        if self.background:
+            self.simulation = SimulationThread(self.engine, self.delay / 1000.0,
+                                               on_generation=self._record_generation)
+            self.simulation.start()
+            scheduler.step = self.show_latest
+            scheduler.render = None
+            if self.render_delay is None:
+                scheduler.setPeriod(self.delay)
+            else:
+                scheduler.setPeriod(self.render_delay)
+        elif self.render_delay is None:
+            scheduler.setPeriod(self.delay)
+            scheduler.step = self.simulate
+            scheduler.render = None
+        else:
+            scheduler.setPeriod(self.delay)
+            scheduler.step = self.advance
+            scheduler.render = self.redraw
+            scheduler.renderPeriod = self.render_delay
+        scheduler.start()
+
+    def show_latest(self):
+        '''
+        Draws the newest generation computed by the background simulation,
+        skipping any generations that were computed since the last call.
+        Stops or slows down the simulation once the frame shows that the
+        board has settled, and stops animating once the simulation has
+        stopped.
+        '''
+        frame = self.simulation.latest()
+        if frame is None:
+            if not self.simulation.running:
+                self.stop()
+            return
+        generation, snapshot, settled = frame
+        self.renderer.render(self.shown, snapshot)
+        self.shown = snapshot
+        if settled is not None:
+            if self.on_settle == 'stop':
+                self.simulation.stop(wait=False)
+            elif self.on_settle == 'slow':
+                self.simulation.delay = max(self.delay, self.settle_delay) / 1000.0
+
+    def stop(self):
+        '''
+        Stops animating, including the background simulation if any.
         '''
-        self.simulate()
-        self.win.after(self.delay, self.animate)
+        self.scheduler.stop()
+        if self.simulation is not None:
+            # stopping makes the edits the thread had not made yet
+            self.simulation.stop()
+            self.simulation = None
+            self.redraw()
 
 ################################################################
 
@@ -10,7 +10,10 @@ LICENSE: This is open-source software released under the terms of the
 GPL (http://www.gnu.org/licenses/gpl.html).
 
 PLATFORMS: The package is a wrapper around Tkinter and should run on
-any platform where Tkinter is available.
+any platform where Tkinter is available. Without a display, set the
+environment variable GRAPHICS_BACKEND=null to draw into plain Python
+structures instead (see NullCanvas); this also happens automatically
+when Tkinter is missing.
 
 INSTALLATION: Put this file somewhere where Python can see it.
 
@@ -126,17 +129,20 @@ http://mcsp.wartburg.edu/zelle/python for a quick reference"""
 #     Added ability to set text atttributes.
 #     Added Entry boxes.
 
-import time, os, sys
-import Tkinter
-tk = Tkinter
+import time, os, sys, math, base64, heapq, re, struct, zlib
+try:
+    import Tkinter
+except ImportError:
+    try:
+        import tkinter as Tkinter
+    except ImportError:
+        Tkinter = None
 
 
 ##########################################################################
 # Module Exceptions
 
-import exceptions
-
-class GraphicsError(exceptions.Exception):
+class GraphicsError(Exception):
     """Generic error class for graphics module exceptions."""
     #def __init__(self, *args):
         #self.args=args
@@ -148,6 +154,548 @@ UNSUPPORTED_METHOD = "Object doesn't support operation"
 BAD_OPTION = "Illegal option value"
 
 
+##########################################################################
+# Headless backend
+#
+# The null backend stands in for Tkinter when there is no display (or
+#   no Tkinter at all). It keeps the canvas items in plain Python
+#   dictionaries and runs after() callbacks from mainloop on a virtual
+#   clock, so the same programs run headless, as fast as they can. It
+#   is chosen with the GRAPHICS_BACKEND environment variable:
+#
+#      GRAPHICS_BACKEND=null python tetris.py
+#
+#   and is used automatically when Tkinter cannot be imported.
+
+class NullTclError(Exception):
+    """Raised where Tk would raise TclError"""
+    pass
+
+class NullWidget:
+
+    """Headless widget: accepts and ignores the usual widget calls"""
+
+    def __init__(self, parent=None, *args, **options):
+        self.parent = parent
+
+    def pack(self, *args, **options): pass
+    def bind(self, *args): pass
+    def config(self, *args, **options): pass
+    configure = config
+    def update(self): pass
+    def update_idletasks(self): pass
+    def destroy(self): pass
+
+class NullTk(NullWidget):
+
+    """Headless top-level window. after() callbacks are kept in a heap
+    and run by mainloop in the order they are due; the virtual clock
+    jumps to each callback's due time instead of waiting for it."""
+
+    def __init__(self, *args, **options):
+        NullWidget.__init__(self)
+        self.now = 0.0
+        self.destroyed = False
+        self._timers = []
+        self._cancelled = set()
+        self._afterCount = 0
+        self._quit = False
+
+    def title(self, *args): pass
+    def protocol(self, *args): pass
+    def resizable(self, *args): pass
+    def lift(self): pass
+    def bind_all(self, *args): pass
+    def unbind_all(self, *args): pass
+
+    def clock(self):
+        """Return the virtual time in seconds"""
+        return self.now
+
+    def after(self, ms, func=None, *args):
+        self._afterCount = self._afterCount + 1
+        id = "after#%d" % self._afterCount
+        if func is None:
+            self.now = self.now + ms / 1000.0
+            return None
+        heapq.heappush(self._timers, (self.now + ms / 1000.0,
+                                      self._afterCount, id, func, args))
+        return id
+
+    def after_idle(self, func, *args):
+        return self.after(0, func, *args)
+
+    def after_cancel(self, id):
+        self._cancelled.add(id)
+
+    def runFor(self, ms):
+        """Run the callbacks due in the next ms of virtual time"""
+        end = self.now + ms / 1000.0
+        self._run(end)
+        self.now = max(self.now, end)
+
+    def mainloop(self, n=0):
+        """Run callbacks until there are none left, or until quit or
+        destroy is called"""
+        self._quit = False
+        self._run(None)
+
+    def _run(self, end):
+        while self._timers and not self._quit and not self.destroyed:
+            due, count, id, func, args = self._timers[0]
+            if end is not None and due > end:
+                break
+            heapq.heappop(self._timers)
+            if id in self._cancelled:
+                self._cancelled.discard(id)
+                continue
+            self.now = max(self.now, due)
+            func(*args)
+
+    def quit(self):
+        self._quit = True
+
+    def destroy(self):
+        self.destroyed = True
+        self._timers = []
+
+class NullCanvas(NullWidget):
+
+    """Headless canvas: records the items drawn on it. items maps an
+    item id to [type, coords, options]; the usual query methods
+    (coords, itemcget, type, find_all) work on the recorded items."""
+
+    def __init__(self, parent=None, width=0, height=0, **options):
+        NullWidget.__init__(self, parent)
+        self.width = width
+        self.height = height
+        self.background = "#d9d9d9"
+        self.items = {}
+        self._order = {}
+        self._count = 0
+
+    def config(self, *args, **options):
+        self.background = options.get("bg", options.get("background",
+                                                        self.background))
+    configure = config
+
+    def _add(self, id, itemType, coords, options):
+        self._count = self._count + 1
+        self.items[id] = [itemType, [float(c) for c in coords], dict(options)]
+        self._order[id] = self._count
+
+    def _create(self, itemType, args, kw):
+        args = list(args)
+        options = {}
+        if args and isinstance(args[-1], dict):
+            options = dict(args.pop())
+        options.update(kw)
+        self._add(self._count + 1, itemType, args, options)
+        return self._count
+
+    def delete(self, id):
+        self.items.pop(id, None)
+        self._order.pop(id, None)
+
+    def move(self, id, dx, dy):
+        coords = self.items[id][1]
+        for i in range(0, len(coords) - 1, 2):
+            coords[i] = coords[i] + dx
+            coords[i+1] = coords[i+1] + dy
+
+    def coords(self, id, *coords):
+        if coords:
+            self.items[id][1] = [float(c) for c in coords]
+        return list(self.items[id][1])
+
+    def itemconfig(self, id, options=None, **kw):
+        item = self.items[id][2]
+        item.update(options or {})
+        item.update(kw)
+    itemconfigure = itemconfig
+
+    def itemcget(self, id, option):
+        return self.items[id][2].get(option, "")
+
+    def type(self, id):
+        return self.items[id][0]
+
+    def tag_raise(self, id):
+        self._count = self._count + 1
+        self._order[id] = self._count
+
+    def find_all(self):
+        """Return the item ids in stacking order, bottom first"""
+        order = self._order
+        return sorted(self.items, key=lambda id: order[id])
+
+    def runBatch(self, ops):
+        # Internal method: apply the queued operations of a
+        #   CanvasFrame batch directly, instead of as a Tcl script
+        for op in ops:
+            kind = op[0]
+            if kind == "create":
+                self._add(op[1], op[2], op[3], op[4])
+            elif kind == "move":
+                self.move(op[1], op[2], op[3])
+            elif kind == "config":
+                self.itemconfig(op[1], op[2])
+            elif kind == "delete":
+                self.delete(op[1])
+            elif kind == "coords":
+                self.coords(op[1], *op[2])
+            elif kind == "raise":
+                self.tag_raise(op[1])
+
+class NullPhotoImage:
+
+    """Headless image: keeps its size and the last data put into it"""
+
+    def __init__(self, file=None, width=0, height=0, data=None, **options):
+        if file is not None:
+            raise NullTclError("can't read image files without Tk")
+        self._width = width
+        self._height = height
+        self.data = data
+
+    def width(self): return self._width
+    def height(self): return self._height
+    def get(self, x, y): return (0, 0, 0)
+    def put(self, data, to=None): self.data = data
+
+    def configure(self, data=None, format=None, **options):
+        self.data = data
+    config = configure
+
+    def copy(self):
+        other = NullPhotoImage(width=self._width, height=self._height)
+        other.data = self.data
+        return other
+
+    def write(self, filename, format=None):
+        raise NullTclError("can't write images without Tk")
+
+class NullStringVar:
+
+    """Headless StringVar"""
+
+    def __init__(self, master=None, value=""):
+        self.value = value
+
+    def get(self): return self.value
+    def set(self, value): self.value = value
+
+class _NullTkinter:
+
+    """Stands in for the Tkinter module with the null backend"""
+
+    Tk = NullTk
+    Frame = NullWidget
+    Entry = NullWidget
+    Canvas = NullCanvas
+    PhotoImage = NullPhotoImage
+    StringVar = NullStringVar
+    TclError = NullTclError
+
+
+##########################################################################
+# Frame export
+#
+# A Raster is an RGB pixel buffer that the items of a NullCanvas are
+#   drawn into, so the frames of a headless program can be saved as PNG
+#   or PPM files (see CanvasFrame.saveFrame). Nothing is rasterized
+#   until a frame is saved.
+
+COLORS = {"black": (0, 0, 0), "white": (255, 255, 255),
+          "red": (255, 0, 0), "green": (0, 255, 0), "blue": (0, 0, 255),
+          "yellow": (255, 255, 0), "cyan": (0, 255, 255),
+          "magenta": (255, 0, 255), "orange": (255, 165, 0),
+          "purple": (160, 32, 240), "pink": (255, 192, 203),
+          "brown": (165, 42, 42), "gray": (190, 190, 190),
+          "lightgray": (211, 211, 211), "darkgray": (169, 169, 169),
+          "lightblue": (173, 216, 230), "darkblue": (0, 0, 139),
+          "lightgreen": (144, 238, 144), "darkgreen": (0, 100, 0)}
+
+# 5x7 bitmap font: seven rows of five bits per character, as hex.
+#   Lower case letters are drawn as capitals.
+_FONT = {
+    " ": "00000000000000", "0": "0e11131519110e", "1": "040c040404040e",
+    "2": "0e11010204081f", "3": "1f02040201110e", "4": "02060a121f0202",
+    "5": "1f101e0101110e", "6": "0608101e11110e", "7": "1f010204080808",
+    "8": "0e11110e11110e", "9": "0e11110f01020c", "A": "0e1111111f1111",
+    "B": "1e11111e11111e", "C": "0e11101010110e", "D": "1c12111111121c",
+    "E": "1f10101e10101f", "F": "1f10101e101010", "G": "0e11101711110f",
+    "H": "1111111f111111", "I": "0e04040404040e", "J": "0702020202120c",
+    "K": "11121418141211", "L": "1010101010101f", "M": "111b1515111111",
+    "N": "11111915131111", "O": "0e11111111110e", "P": "1e11111e101010",
+    "Q": "0e11111115120d", "R": "1e11111e141211",
+    "S": "0f10100e01011e", "T": "1f040404040404", "U": "1111111111110e",
+    "V": "11111111110a04", "W": "1111111515150a",
+    "X": "11110a040a1111", "Y": "1111110a040404", "Z": "1f01020408101f",
+    ":": "000c0c000c0c00", ".": "00000000000c0c", ",": "000000000c0408",
+    "-": "0000001f000000", "+": "0004041f040400",
+    "=": "00001f001f0000", "!": "04040404040004", "?": "0e110102040004",
+    "/": "00010204081000", "(": "02040808080402", ")": "08040202020408",
+    "'": "0c040800000000"}
+
+def _colorBytes(color, cache={}):
+    # Internal function: a Tk color name or #rgb/#rrggbb as 3 bytes,
+    #   or None for no color
+    if not color:
+        return None
+    value = cache.get(color)
+    if value is None:
+        name = color.replace(" ", "").lower()
+        if name.startswith("#") and len(name) in (4, 7, 13):
+            digits = (len(name) - 1) // 3
+            # the top two hex digits of each component
+            rgb = [int((name[1+i*digits:1+(i+1)*digits] * 2)[:2], 16)
+                   for i in range(3)]
+        elif name.replace("grey", "gray") in COLORS:
+            rgb = COLORS[name.replace("grey", "gray")]
+        else:
+            raise GraphicsError("unknown color %r" % color)
+        value = cache[color] = bytes(bytearray(rgb))
+    return value
+
+class Raster:
+
+    """An RGB pixel buffer with simple drawing primitives. pixels is a
+    bytearray of width*height r,g,b triples, row by row."""
+
+    def __init__(self, width, height, background="white"):
+        self.width = width
+        self.height = height
+        self.pixels = bytearray(_colorBytes(background) * (width * height))
+
+    def fillRect(self, x1, y1, x2, y2, color):
+        """Fill the pixels x1 <= x < x2, y1 <= y < y2"""
+        x1 = max(int(x1), 0); x2 = min(int(x2), self.width)
+        y1 = max(int(y1), 0); y2 = min(int(y2), self.height)
+        if x1 >= x2 or y1 >= y2:
+            return
+        span = color * (x2 - x1)
+        stride = self.width * 3
+        pixels = self.pixels
+        for row in range(y1 * stride, y2 * stride, stride):
+            pixels[row + x1 * 3:row + x2 * 3] = span
+
+    def rectangle(self, x1, y1, x2, y2, fill, outline, width=1):
+        x1, x2 = sorted((int(round(x1)), int(round(x2))))
+        y1, y2 = sorted((int(round(y1)), int(round(y2))))
+        if fill:
+            self.fillRect(x1, y1, x2, y2, fill)
+        if outline and width > 0:
+            # the outline is centred on the edges, like in Tk
+            a = width // 2
+            b = width - a
+            self.fillRect(x1 - a, y1 - a, x2 + b, y1 + b, outline)
+            self.fillRect(x1 - a, y2 - a, x2 + b, y2 + b, outline)
+            self.fillRect(x1 - a, y1 - a, x1 + b, y2 + b, outline)
+            self.fillRect(x2 - a, y1 - a, x2 + b, y2 + b, outline)
+
+    def line(self, x1, y1, x2, y2, color, width=1):
+        width = max(int(width), 1)
+        a = width // 2
+        b = width - a
+        x1 = int(round(x1)); y1 = int(round(y1))
+        x2 = int(round(x2)); y2 = int(round(y2))
+        if x1 == x2 or y1 == y2:
+            self.fillRect(min(x1, x2) - a, min(y1, y2) - a,
+                          max(x1, x2) + b, max(y1, y2) + b, color)
+            return
+        steps = max(abs(x2 - x1), abs(y2 - y1))
+        for i in range(steps + 1):
+            x = x1 + (x2 - x1) * i // steps
+            y = y1 + (y2 - y1) * i // steps
+            self.fillRect(x - a, y - a, x + b, y + b, color)
+
+    def _ellipseSpan(self, cx, cy, rx, ry, y):
+        # Internal method: the pixels [a, b) of row y inside the ellipse
+        if rx <= 0 or ry <= 0:
+            return None
+        d = (y + 0.5 - cy) / ry
+        if abs(d) > 1:
+            return None
+        half = rx * math.sqrt(1 - d * d)
+        return int(round(cx - half)), int(round(cx + half))
+
+    def oval(self, x1, y1, x2, y2, fill, outline, width=1):
+        x1, x2 = sorted((x1, x2))
+        y1, y2 = sorted((y1, y2))
+        cx = (x1 + x2) / 2.0
+        cy = (y1 + y2) / 2.0
+        rx = (x2 - x1) / 2.0
+        ry = (y2 - y1) / 2.0
+        if not outline:
+            width = 0
+        for y in range(int(y1), int(math.ceil(y2))):
+            outer = self._ellipseSpan(cx, cy, rx, ry, y)
+            if outer is None:
+                continue
+            inner = self._ellipseSpan(cx, cy, rx - width, ry - width, y)
+            if inner is None:
+                if width:
+                    self.fillRect(outer[0], y, outer[1], y + 1, outline)
+                continue
+            if fill:
+                self.fillRect(inner[0], y, inner[1], y + 1, fill)
+            if width:
+                self.fillRect(outer[0], y, inner[0], y + 1, outline)
+                self.fillRect(inner[1], y, outer[1], y + 1, outline)
+
+    def polygon(self, coords, fill, outline, width=1):
+        points = list(zip(coords[0::2], coords[1::2]))
+        if fill and len(points) > 2:
+            ys = [p[1] for p in points]
+            edges = list(zip(points, points[1:] + points[:1]))
+            for y in range(int(min(ys)), int(math.ceil(max(ys)))):
+                yc = y + 0.5
+                xs = []
+                for (xa, ya), (xb, yb) in edges:
+                    if (ya <= yc < yb) or (yb <= yc < ya):
+                        xs.append(xa + (yc - ya) * (xb - xa) / (yb - ya))
+                xs.sort()
+                for i in range(0, len(xs) - 1, 2):
+                    self.fillRect(int(round(xs[i])), y,
+                                  int(round(xs[i+1])), y + 1, fill)
+        if outline and width > 0:
+            for (xa, ya), (xb, yb) in zip(points, points[1:] + points[:1]):
+                self.line(xa, ya, xb, yb, outline, width)
+
+    def text(self, x, y, text, color, size=12, bold=False):
+        """Draw text centred on (x, y) with the built-in 5x7 font,
+        scaled to roughly the height of a font of the given size"""
+        scale = max(1, int(abs(size) * 0.75 / 7 + 0.5))
+        lines = str(text).split("\n")
+        top = int(round(y - (len(lines) * 9 - 2) * scale / 2.0))
+        for line in lines:
+            left = int(round(x - (len(line) * 6 - 1) * scale / 2.0))
+            for char in line:
+                glyph = _FONT.get(char.upper(), _FONT["?"])
+                for row in range(7):
+                    bits = int(glyph[row*2:row*2+2], 16)
+                    for col in range(5):
+                        if bits & (16 >> col):
+                            px = left + col * scale
+                            py = top + row * scale
+                            self.fillRect(px, py, px + scale + bold,
+                                          py + scale, color)
+                left = left + 6 * scale
+            top = top + 9 * scale
+
+    def blit(self, x, y, width, height, data):
+        """Copy width*height r,g,b bytes to the pixels with their top
+        left corner at (x, y)"""
+        stride = self.width * 3
+        x1 = max(x, 0); x2 = min(x + width, self.width)
+        if x1 >= x2:
+            return
+        for row in range(max(y, 0), min(y + height, self.height)):
+            src = ((row - y) * width + x1 - x) * 3
+            self.pixels[row * stride + x1 * 3:row * stride + x2 * 3] = \
+                data[src:src + (x2 - x1) * 3]
+
+    def toPPM(self):
+        """Return the pixels as a binary PPM (P6) image"""
+        header = ("P6 %d %d 255\n" % (self.width, self.height)).encode("ascii")
+        return header + bytes(self.pixels)
+
+    def toPNG(self, level=1):
+        """Return the pixels as a PNG image. level is the zlib level;
+        the default is the fastest, which suits the flat colors of
+        drawn frames"""
+        stride = self.width * 3
+        pixels = bytes(self.pixels)
+        raw = b"".join([b"\0" + pixels[row:row + stride]
+                        for row in range(0, len(pixels), stride)])
+        def chunk(kind, data):
+            crc = zlib.crc32(kind + data) & 0xffffffff
+            return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", crc)
+        return (b"\x89PNG\r\n\x1a\n"
+                + chunk(b"IHDR", struct.pack(">IIBBBBB", self.width, self.height,
+                                             8, 2, 0, 0, 0))
+                + chunk(b"IDAT", zlib.compress(raw, level))
+                + chunk(b"IEND", b""))
+
+    def save(self, filename):
+        """Write the pixels to filename, as PNG if it ends in .png,
+        otherwise as PPM"""
+        if filename.lower().endswith(".png"):
+            data = self.toPNG()
+        else:
+            data = self.toPPM()
+        f = open(filename, "wb")
+        try:
+            f.write(data)
+        finally:
+            f.close()
+
+def _ppmPixels(data):
+    # Internal function: (width, height, pixels) of P6 image data, as
+    #   put into a PhotoImage by Pixmap.putPPM, or None
+    if not data:
+        return None
+    if not isinstance(data, bytes) or not data.startswith(b"P6"):
+        try:
+            data = base64.b64decode(data)
+        except (TypeError, ValueError):
+            return None
+    match = re.match(br"P6\s+(\d+)\s+(\d+)\s+255\s", data)
+    if not match:
+        return None
+    return int(match.group(1)), int(match.group(2)), data[match.end():]
+
+def rasterize(canvas):
+    """Draw the visible items of a NullCanvas into a new Raster, in
+    stacking order"""
+    raster = Raster(canvas.width, canvas.height, canvas.background)
+    for id in canvas.find_all():
+        itemType, coords, options = canvas.items[id]
+        if options.get("state") == "hidden":
+            continue
+        fill = _colorBytes(options.get("fill", ""))
+        outline = _colorBytes(options.get("outline", ""))
+        width = int(float(options.get("width", 1)))
+        if itemType == "rectangle":
+            raster.rectangle(coords[0], coords[1], coords[2], coords[3],
+                             fill, outline, width)
+        elif itemType == "oval":
+            raster.oval(coords[0], coords[1], coords[2], coords[3],
+                        fill, outline, width)
+        elif itemType == "line":
+            for i in range(0, len(coords) - 3, 2):
+                raster.line(coords[i], coords[i+1], coords[i+2], coords[i+3],
+                            fill or _colorBytes("black"), width)
+        elif itemType == "polygon":
+            raster.polygon(coords, fill, outline, width)
+        elif itemType == "text":
+            font = options.get("font", DEFAULT_CONFIG["font"])
+            if isinstance(font, str):
+                font = font.split()
+            raster.text(coords[0], coords[1], options.get("text", ""),
+                        fill or _colorBytes("black"), int(font[1]),
+                        "bold" in font[2:])
+        elif itemType == "image":
+            image = _ppmPixels(getattr(options.get("image"), "data", None))
+            if image:
+                w, h, data = image
+                raster.blit(int(coords[0]) - w // 2, int(coords[1]) - h // 2,
+                            w, h, data)
+    return raster
+
+BACKEND = os.environ.get("GRAPHICS_BACKEND", "tk")
+if BACKEND not in ("tk", "null"):
+    raise GraphicsError("GRAPHICS_BACKEND must be tk or null, not %r" % BACKEND)
+if Tkinter is None:
+    BACKEND = "null"
+
+if BACKEND == "null":
+    tk = _NullTkinter
+else:
+    tk = Tkinter
+
+
     
 ############################################################################
 # Graphics classes start here
@@ -156,6 +704,12 @@ class CanvasFrame(tk.Frame):
 
     """A CanvasFrame is a frame for displaying graphics."""
 
+    _tagCount = 0
+    _drawCount = 0
+
+    # side in pixels of the squares of the spatial index
+    indexCellSize = 64
+
     def __init__(self, parent, width=200, height=200):
         
         tk.Frame.__init__(self, parent)
@@ -175,11 +729,22 @@ class CanvasFrame(tk.Frame):
         self._keyboardCallback = None
         self.trans = None
         self.closed = False
+        self._batchDepth = 0
+        self._batchOps = []
+        self._batchItems = {}
+        self.batches = 0
+        self._pool = None
+        self._poolKeys = {}
+        self.reused = 0
+        self.framesSaved = 0
+        self._drawn = {}
+        self._cells = None
+        self._boxes = {}
         parent.lift()
 
     def __checkOpen(self):
         if self.closed:
-            raise (GraphicsError, "window is closed")
+            raise GraphicsError("window is closed")
 
     def setBackground(self, color):
         """Set background color of the window"""
@@ -207,27 +772,225 @@ class CanvasFrame(tk.Frame):
         """Set pixel (x,y) to the given color"""
         self.__checkOpen()
         xs,ys = self.toScreen(x,y)
-        self.create_line(xs,ys,xs+1,ys, fill=color)
+        self.createItem("line", (xs,ys,xs+1,ys), {"fill": color})
         
     def plotPixel(self, x, y, color="black"):
         """Set pixel raw (independent of window coordinates) pixel
         (x,y) to color"""
         self.__checkOpen()
-        self.create_line(x,y,x+1,y, fill=color)
+        self.createItem("line", (x,y,x+1,y), {"fill": color})
         
     def flush(self):
         """Update drawing to the window"""        
         self.__checkOpen()
         self.update_idletasks()
+
+    # Batches: between beginBatch and endBatch, item creations,
+    #   deletions, moves and option changes are queued instead of each
+    #   being a call into Tcl. Operations on the same item are merged
+    #   (two moves become one move, a move of an item created in the
+    #   batch changes its coordinates, an item created and deleted in
+    #   the batch is never created) and the rest is sent as one Tcl
+    #   script when the outermost batch ends.
+
+    def beginBatch(self):
+        """Start queueing drawing operations. Batches may be nested;
+        nothing is drawn until the outermost endBatch."""
+        self._batchDepth = self._batchDepth + 1
+
+    def endBatch(self):
+        """End a batch started with beginBatch; the outermost endBatch
+        draws everything that was queued"""
+        self._batchDepth = self._batchDepth - 1
+        if self._batchDepth == 0:
+            self.flushBatch()
+
+    def saveFrame(self, filename):
+        """Save what is drawn in the window as an image file: PNG if
+        filename ends in .png, otherwise PPM. A %d in filename is
+        replaced by the number of frames saved so far, so
+           win.saveFrame("frames/%05d.png")
+        writes a numbered sequence. Needs the null backend. Returns the
+        name of the file written."""
+        if BACKEND != "null":
+            raise GraphicsError("saveFrame needs GRAPHICS_BACKEND=null")
+        self.flushBatch()
+        if "%" in filename:
+            filename = filename % self.framesSaved
+        rasterize(self.canvas).save(filename)
+        self.framesSaved = self.framesSaved + 1
+        return filename
+
+    def batch(self):
+        """Return a context manager for a batch:
+               with win.batch():
+                   ...draw, move and undraw objects...
+        """
+        return _Batch(self)
+
+    def flushBatch(self):
+        """Send the queued operations to Tk now, in one evaluation"""
+        ops = self._batchOps
+        self._batchOps = []
+        self._batchItems = {}
+        if self.closed: return
+        if BACKEND == "null":
+            if ops:
+                self.canvas.runBatch(ops)
+                self.batches = self.batches + 1
+            return
+        w = self.canvas._w
+        lines = []
+        for op in ops:
+            kind = op[0]
+            if kind == "create":
+                lines.append("%s create %s %s %s -tags %s" % (
+                    w, op[2], " ".join([_tclQuote(c) for c in op[3]]),
+                    _tclOptions(op[4]), op[1]))
+            elif kind == "move":
+                if op[2] or op[3]:
+                    lines.append("%s move %s %s %s" % (
+                        w, op[1], _tclQuote(op[2]), _tclQuote(op[3])))
+            elif kind == "config":
+                lines.append("%s itemconfigure %s %s" % (
+                    w, op[1], _tclOptions(op[2])))
+            elif kind == "delete":
+                lines.append("%s delete %s" % (w, op[1]))
+            elif kind == "coords":
+                lines.append("%s coords %s %s" % (
+                    w, op[1], " ".join([_tclQuote(c) for c in op[2]])))
+            elif kind == "raise":
+                lines.append("%s raise %s" % (w, op[1]))
+        if lines:
+            self.canvas.tk.eval("\n".join(lines))
+            self.batches = self.batches + 1
+
+    def _queue(self, op):
+        self._batchOps.append(op)
+        self._batchItems.setdefault(op[1], []).append(op)
+
+    def _lastOp(self, id):
+        ops = self._batchItems.get(id)
+        if ops and ops[-1][0]:
+            return ops[-1]
+        return None
+
+    def createItem(self, itemType, coords, options):
+        """Create a canvas item of itemType ("rectangle", "line", ...)
+        at the screen coordinates coords with the options dictionary.
+        Returns the item's id; inside a batch the id is a tag that
+        names the item once the batch is drawn. With pooling on, a
+        hidden item of the same type and option names is reused."""
+        if self._pool is not None and itemType != "window":
+            key = (itemType,) + tuple(sorted(options))
+            ids = self._pool.get(key)
+            if ids:
+                id = ids.pop()
+                self._reuseItem(id, coords, options)
+                return id
+            id = self._createItem(itemType, coords, options)
+            self._poolKeys[id] = key
+            return id
+        return self._createItem(itemType, coords, options)
+
+    def _createItem(self, itemType, coords, options):
+        if not self._batchDepth:
+            return self.canvas._create(itemType, tuple(coords) + (options,), {})
+        CanvasFrame._tagCount = CanvasFrame._tagCount + 1
+        tag = "gi%d" % CanvasFrame._tagCount
+        self._queue(["create", tag, itemType, list(coords), dict(options)])
+        return tag
+
+    def _reuseItem(self, id, coords, options):
+        # Internal method: show a pooled item as if it were created now,
+        #   on top of the other items
+        self.beginBatch()
+        self._queue(["raise", id])
+        self._queue(["coords", id, list(coords)])
+        options = dict(options)
+        options["state"] = "normal"
+        self._queue(["config", id, options])
+        self.endBatch()
+        self.reused = self.reused + 1
+
+    def setPooling(self, on=True):
+        """Turn item pooling on or off. With pooling on, deleteItem
+        only hides an item, and the next createItem of the same item
+        type and option names shows it again with the new coordinates
+        and options, so drawing and undrawing objects does not create
+        and destroy Tk items."""
+        if on:
+            if self._pool is None:
+                self._pool = {}
+            return
+        if self._pool is not None:
+            pool = self._pool
+            self._pool = None
+            self._poolKeys = {}
+            self.beginBatch()
+            for ids in pool.values():
+                for id in ids:
+                    self.deleteItem(id)
+            self.endBatch()
+
+    def deleteItem(self, id):
+        """Delete the canvas item id, or hide it for reuse if pooling
+        is on"""
+        if self._pool is not None and id in self._poolKeys:
+            self.configItem(id, {"state": "hidden"})
+            self._pool.setdefault(self._poolKeys[id], []).append(id)
+            return
+        if not self._batchDepth:
+            self.canvas.delete(id)
+            return
+        created = False
+        for op in self._batchItems.pop(id, []):
+            if op[0] == "create":
+                created = True
+            op[0] = None
+        if not created:
+            self._queue(["delete", id])
+
+    def moveItem(self, id, dx, dy):
+        """Move the canvas item id by dx,dy screen pixels"""
+        if not self._batchDepth:
+            self.canvas.move(id, dx, dy)
+            return
+        op = self._lastOp(id)
+        if op and op[0] == "move":
+            op[2] = op[2] + dx
+            op[3] = op[3] + dy
+        elif op and op[0] == "create":
+            coords = op[3]
+            for i in range(0, len(coords) - 1, 2):
+                coords[i] = coords[i] + dx
+                coords[i+1] = coords[i+1] + dy
+        else:
+            self._queue(["move", id, dx, dy])
+
+    def configItem(self, id, options):
+        """Change the options of the canvas item id"""
+        if not self._batchDepth:
+            self.canvas.itemconfig(id, options)
+            return
+        op = self._lastOp(id)
+        if op and op[0] == "config":
+            op[2].update(options)
+        elif op and op[0] == "create":
+            op[4].update(options)
+        else:
+            self._queue(["config", id, dict(options)])
         
     def getMouse(self):
         """Wait for mouse click and return Point object representing
         the click"""
+        if BACKEND == "null":
+            raise GraphicsError("getMouse needs a display")
         self.mouseX = None
         self.mouseY = None
         while self.mouseX == None or self.mouseY == None:
             self.update()
-            if self.isClosed(): raise (GraphicsError, "getMouse in closed window")
+            if self.isClosed(): raise GraphicsError("getMouse in closed window")
             time.sleep(.1) # give up thread
         x,y = self.toWorld(self.mouseX, self.mouseY)
         self.mouseX = None
@@ -238,7 +1001,7 @@ class CanvasFrame(tk.Frame):
         """Return last mouse click or None if mouse has
         not been clicked since last call"""
         if self.isClosed():
-            raise (GraphicsError, "checkMouse in closed window")
+            raise GraphicsError("checkMouse in closed window")
         self.update()
         if self.mouseX != None and self.mouseY != None:
             x,y = self.toWorld(self.mouseX, self.mouseY)
@@ -270,6 +1033,95 @@ class CanvasFrame(tk.Frame):
         else:
             return x,y
         
+    # Spatial index: the screen bounding box of every drawn object is
+    #   filed under each indexCellSize square it touches, so findAt and
+    #   findInRect only look at the objects near the query instead of
+    #   at every object in the window. The index is built by the first
+    #   query, so windows that are never hit-tested do not keep it up
+    #   to date on every draw and move.
+
+    def _indexAdd(self, obj):
+        CanvasFrame._drawCount = CanvasFrame._drawCount + 1
+        obj._drawOrder = CanvasFrame._drawCount
+        self._drawn[obj] = None
+        if self._cells is not None:
+            self._fileBox(obj)
+
+    def _indexRemove(self, obj):
+        self._drawn.pop(obj, None)
+        if self._cells is not None:
+            self._unfileBox(obj)
+
+    def _indexMove(self, obj):
+        if self._cells is not None:
+            self._unfileBox(obj)
+            self._fileBox(obj)
+
+    def _buildIndex(self):
+        if self._cells is None:
+            self._cells = {}
+            for obj in self._drawn:
+                self._fileBox(obj)
+
+    def _fileBox(self, obj):
+        box = obj._screenBox(self)
+        if box is None:
+            return
+        self._boxes[obj] = box
+        size = self.indexCellSize
+        for cx in range(int(box[0] // size), int(box[2] // size) + 1):
+            for cy in range(int(box[1] // size), int(box[3] // size) + 1):
+                cell = self._cells.get((cx, cy))
+                if cell is None:
+                    cell = self._cells[(cx, cy)] = {}
+                cell[obj] = None
+
+    def _unfileBox(self, obj):
+        box = self._boxes.pop(obj, None)
+        if box is None:
+            return
+        size = self.indexCellSize
+        for cx in range(int(box[0] // size), int(box[2] // size) + 1):
+            for cy in range(int(box[1] // size), int(box[3] // size) + 1):
+                cell = self._cells[(cx, cy)]
+                del cell[obj]
+                if not cell:
+                    del self._cells[(cx, cy)]
+
+    def findAt(self, x, y):
+        """Return the drawn objects whose bounding box contains the
+        point (x,y), topmost first"""
+        self._buildIndex()
+        sx, sy = self.toScreen(x, y)
+        size = self.indexCellSize
+        cell = self._cells.get((int(sx // size), int(sy // size)), {})
+        boxes = self._boxes
+        found = [obj for obj in cell
+                 if boxes[obj][0] <= sx <= boxes[obj][2]
+                 and boxes[obj][1] <= sy <= boxes[obj][3]]
+        found.sort(key=lambda obj: -obj._drawOrder)
+        return found
+
+    def findInRect(self, x1, y1, x2, y2):
+        """Return the drawn objects whose bounding box overlaps the
+        rectangle with corners (x1,y1) and (x2,y2), in drawing order"""
+        self._buildIndex()
+        ax, ay = self.toScreen(x1, y1)
+        bx, by = self.toScreen(x2, y2)
+        ax, bx = min(ax, bx), max(ax, bx)
+        ay, by = min(ay, by), max(ay, by)
+        size = self.indexCellSize
+        boxes = self._boxes
+        found = {}
+        for cx in range(int(ax // size), int(bx // size) + 1):
+            for cy in range(int(ay // size), int(by // size) + 1):
+                for obj in self._cells.get((cx, cy), ()):
+                    box = boxes[obj]
+                    if (box[0] <= bx and ax <= box[2]
+                            and box[1] <= by and ay <= box[3]):
+                        found[obj] = None
+        return sorted(found, key=lambda obj: obj._drawOrder)
+
     def setMouseHandler(self, func):
         self._mouseCallback = func
         
@@ -280,6 +1132,50 @@ class CanvasFrame(tk.Frame):
             self._mouseCallback(Point(e.x, e.y))
 
 
+class _Batch:
+
+    """Internal context manager returned by CanvasFrame.batch"""
+
+    def __init__(self, canvas_frame):
+        self.canvas_frame = canvas_frame
+
+    def __enter__(self):
+        self.canvas_frame.beginBatch()
+        return self.canvas_frame
+
+    def __exit__(self, *exc):
+        self.canvas_frame.endBatch()
+        return False
+
+
+def _tclQuote(value):
+    # Internal function: value as one word of a Tcl script
+    if isinstance(value, (tuple, list)):
+        return _tclQuote(" ".join([_tclQuote(v) for v in value]))
+    if isinstance(value, float):
+        value = repr(value)
+    elif not isinstance(value, str):
+        try:
+            if not isinstance(value, unicode): value = str(value)
+        except NameError:
+            value = str(value)
+    if value and not [c for c in value if c in ' \t\n"\\{}[]$;']:
+        return value
+    return '"' + "".join([_TCL_ESCAPES.get(c, c) for c in value]) + '"'
+
+_TCL_ESCAPES = {'"': '\\"', "\\": "\\\\", "[": "\\[", "]": "\\]",
+                "$": "\\$", "{": "\\{", "}": "\\}", "\n": "\\n",
+                "\t": "\\t"}
+
+def _tclOptions(options):
+    # Internal function: an options dictionary as Tcl arguments
+    words = []
+    for key, value in options.items():
+        words.append("-" + key)
+        words.append(_tclQuote(value))
+    return " ".join(words)
+
+
 class Transform:
 
     """Internal class for 2-D coordinate transformations"""
@@ -318,6 +1214,11 @@ DEFAULT_CONFIG = {"fill":"",
           "justify":"center",
                   "font": ("helvetica", 12, "normal")}
 
+def _widen(box, config):
+    # Internal function: a screen box grown by half the outline width
+    w = float(config.get("width", 1)) / 2.0
+    return (box[0]-w, box[1]-w, box[2]+w, box[3]+w)
+
 class GraphicsObject:
 
     """Generic base class for all of the drawable objects"""
@@ -359,10 +1260,11 @@ class GraphicsObject:
         window. Raises an error if attempt made to draw an object that
         is already visible."""
 
-        if self.canvas_frame and not self.canvas_frame.isClosed(): raise (GraphicsError, OBJ_ALREADY_DRAWN)
-        if canvas_frame.isClosed(): raise (GraphicsError, "Can't draw to closed window")
+        if self.canvas_frame and not self.canvas_frame.isClosed(): raise GraphicsError(OBJ_ALREADY_DRAWN)
+        if canvas_frame.isClosed(): raise GraphicsError("Can't draw to closed window")
         self.canvas_frame = canvas_frame
         self.id = self._draw(canvas_frame, self.config)
+        canvas_frame._indexAdd(self)
 
     def undraw(self):
 
@@ -370,8 +1272,9 @@ class GraphicsObject:
         object is not currently drawn."""
         
         if not self.canvas_frame: return
+        self.canvas_frame._indexRemove(self)
         if not self.canvas_frame.isClosed():
-            self.canvas_frame.canvas.delete(self.id)
+            self.canvas_frame.deleteItem(self.id)
         self.canvas_frame = None
         self.id = None
 
@@ -390,24 +1293,31 @@ class GraphicsObject:
             else:
                 x = dx
                 y = dy
-            self.canvas_frame.canvas.move(self.id, x, y)
+            self.canvas_frame.moveItem(self.id, x, y)
+        if canvas_frame:
+            canvas_frame._indexMove(self)
            
     def _reconfig(self, option, setting):
         # Internal method for changing configuration of the object
         # Raises an error if the option does not exist in the config
         #    dictionary for this object
-        if not self.config.has_key(option):
-            raise (GraphicsError, UNSUPPORTED_METHOD)
+        if option not in self.config:
+            raise GraphicsError(UNSUPPORTED_METHOD)
         options = self.config
         options[option] = setting
         if self.canvas_frame and not self.canvas_frame.isClosed():
-            self.canvas_frame.canvas.itemconfig(self.id, options)
+            self.canvas_frame.configItem(self.id, options)
 
     def _draw(self, canvas_frame, options):
         """draws appropriate figure on canvas with options provided
         Returns Tk id of item drawn"""
         pass # must override in subclass
 
+    def _screenBox(self, canvas_frame):
+        """returns the (x1,y1,x2,y2) screen bounding box of the object
+        for the spatial index, or None to leave it out"""
+        return None
+
     def _move(self, dx, dy):
         """updates internal state of object to move it dx,dy units"""
         pass # must override in subclass
@@ -421,7 +1331,11 @@ class Point(GraphicsObject):
         
     def _draw(self, canvas_frame, options):
         x,y = canvas_frame.toScreen(self.x,self.y)
-        return canvas_frame.canvas.create_rectangle(x,y,x+1,y+1,options)
+        return canvas_frame.createItem("rectangle", (x,y,x+1,y+1), options)
+
+    def _screenBox(self, canvas_frame):
+        x,y = canvas_frame.toScreen(self.x,self.y)
+        return (x,y,x+1,y+1)
         
     def _move(self, dx, dy):
         self.x = self.x + dx
@@ -449,6 +1363,12 @@ class _BBox(GraphicsObject):
         self.p1.y = self.p1.y + dy
         self.p2.x = self.p2.x + dx
         self.p2.y = self.p2.y  + dy
+
+    def _screenBox(self, canvas_frame):
+        x1,y1 = canvas_frame.toScreen(self.p1.x,self.p1.y)
+        x2,y2 = canvas_frame.toScreen(self.p2.x,self.p2.y)
+        return _widen((min(x1,x2), min(y1,y2), max(x1,x2), max(y1,y2)),
+                      self.config)
                 
     def getP1(self): return self.p1.clone()
 
@@ -469,7 +1389,7 @@ class Rectangle(_BBox):
         p2 = self.p2
         x1,y1 = canvas_frame.toScreen(p1.x,p1.y)
         x2,y2 = canvas_frame.toScreen(p2.x,p2.y)
-        return canvas_frame.canvas.create_rectangle(x1,y1,x2,y2,options)
+        return canvas_frame.createItem("rectangle", (x1,y1,x2,y2), options)
         
     def clone(self):
         other = Rectangle(self.p1, self.p2)
@@ -491,7 +1411,7 @@ class Oval(_BBox):
         p2 = self.p2
         x1,y1 = canvas_frame.toScreen(p1.x,p1.y)
         x2,y2 = canvas_frame.toScreen(p2.x,p2.y)
-        return canvas_frame.canvas.create_oval(x1,y1,x2,y2,options)
+        return canvas_frame.createItem("oval", (x1,y1,x2,y2), options)
     
 class Circle(Oval):
     
@@ -526,11 +1446,11 @@ class Line(_BBox):
         p2 = self.p2
         x1,y1 = canvas_frame.toScreen(p1.x,p1.y)
         x2,y2 = canvas_frame.toScreen(p2.x,p2.y)
-        return canvas_frame.canvas.create_line(x1,y1,x2,y2,options)
+        return canvas_frame.createItem("line", (x1,y1,x2,y2), options)
         
     def setArrow(self, option):
         if not option in ["first","last","both","none"]:
-            raise (GraphicsError, BAD_OPTION)
+            raise GraphicsError(BAD_OPTION)
         self._reconfig("arrow", option)
         
 
@@ -540,29 +1460,34 @@ class Polygon(GraphicsObject):
         # if points passed as a list, extract it
         if len(points) == 1 and type(points[0] == type([])):
             points = points[0]
-        self.points = map(Point.clone, points)
+        self.points = list(map(Point.clone, points))
         GraphicsObject.__init__(self, ["outline", "width", "fill"])
         
     def clone(self):
-        other = apply(Polygon, self.points)
+        other = Polygon(*self.points)
         other.config = self.config.copy()
         return other
 
     def getPoints(self):
-        return map(Point.clone, self.points)
+        return list(map(Point.clone, self.points))
 
     def _move(self, dx, dy):
         for p in self.points:
             p.move(dx,dy)
    
     def _draw(self, canvas_frame, options):
-        args = [canvas_frame.canvas]
+        coords = []
         for p in self.points:
             x,y = canvas_frame.toScreen(p.x,p.y)
-            args.append(x)
-            args.append(y)
-        args.append(options)
-        return apply(tk.Canvas.create_polygon, args) 
+            coords.append(x)
+            coords.append(y)
+        return canvas_frame.createItem("polygon", coords, options)
+
+    def _screenBox(self, canvas_frame):
+        screen = [canvas_frame.toScreen(p.x,p.y) for p in self.points]
+        xs = [x for x,y in screen]
+        ys = [y for x,y in screen]
+        return _widen((min(xs), min(ys), max(xs), max(ys)), self.config)
 
 class Text(GraphicsObject):
     
@@ -576,7 +1501,16 @@ class Text(GraphicsObject):
         def _draw(self, canvas_frame, options):
             p = self.anchor
             x,y = canvas_frame.toScreen(p.x,p.y)
-            return canvas_frame.canvas.create_text(x,y,options)
+            return canvas_frame.createItem("text", (x,y), options)
+
+        def _screenBox(self, canvas_frame):
+            # roughly: characters are 0.6 of the font size wide
+            x,y = canvas_frame.toScreen(self.anchor.x,self.anchor.y)
+            size = abs(self.config["font"][1])
+            lines = str(self.config["text"]).split("\n")
+            w = max([len(line) for line in lines]) * size * 0.3
+            h = len(lines) * size * 0.6
+            return (x-w,y-h,x+w,y+h)
             
         def _move(self, dx, dy):
             self.anchor.move(dx,dy)
@@ -600,21 +1534,21 @@ class Text(GraphicsObject):
                 f,s,b = self.config['font']
                 self._reconfig("font",(face,s,b))
             else:
-                raise (GraphicsError, BAD_OPTION)
+                raise GraphicsError(BAD_OPTION)
 
         def setSize(self, size):
             if 5 <= size <= 72:
                 f,s,b = self.config['font']
                 self._reconfig("font", (f,size,b))
             else:
-                raise (GraphicsError, BAD_OPTION)
+                raise GraphicsError(BAD_OPTION)
 
         def setStyle(self, style):
             if style in ['bold','normal','italic', 'bold italic']:
                 f,s,b = self.config['font']
                 self._reconfig("font", (f,s,style))
             else:
-                raise (GraphicsError, BAD_OPTION)
+                raise GraphicsError(BAD_OPTION)
 
         def setTextColor(self, color):
             #self.config['fg'] = color;
@@ -647,7 +1581,7 @@ class Entry(GraphicsObject):
                               font=self.font)
         self.entry.pack()
         #self.setFill(self.fill)
-        return canvas_frame.canvas.create_window(x,y,window=frm)
+        return canvas_frame.createItem("window", (x,y), {"window": frm})
 
     def getText(self):
         return self.text.get()
@@ -688,19 +1622,19 @@ class Entry(GraphicsObject):
         if face in ['helvetica','arial','courier','times roman']:
             self._setFontComponent(0, face)
         else:
-            raise (GraphicsError, BAD_OPTION)
+            raise GraphicsError(BAD_OPTION)
 
     def setSize(self, size):
         if 5 <= size <= 36:
             self._setFontComponent(1,size)
         else:
-            raise (GraphicsError, BAD_OPTION)
+            raise GraphicsError(BAD_OPTION)
 
     def setStyle(self, style):
         if style in ['bold','normal','italic', 'bold italic']:
             self._setFontComponent(2,style)
         else:
-            raise (GraphicsError, BAD_OPTION)
+            raise GraphicsError(BAD_OPTION)
 
     def setTextColor(self, color):
         self.color=color
@@ -719,7 +1653,7 @@ class Image(GraphicsObject):
         self.imageId = Image.idCount
         Image.idCount = Image.idCount + 1
         if type(pixmap) == type(""):
-            self.img = tk.PhotoImage(file=pixmap, master=_root)
+            self.img = tk.PhotoImage(file=pixmap)
         else:
             self.img = pixmap.image
                     
@@ -727,7 +1661,13 @@ class Image(GraphicsObject):
         p = self.anchor
         x,y = canvas_frame.toScreen(p.x,p.y)
         self.imageCache[self.imageId] = self.img # save a reference  
-        return canvas_frame.canvas.create_image(x,y,image=self.img)
+        return canvas_frame.createItem("image", (x,y), {"image": self.img})
+
+    def _screenBox(self, canvas_frame):
+        x,y = canvas_frame.toScreen(self.anchor.x,self.anchor.y)
+        w = self.img.width() / 2.0
+        h = self.img.height() / 2.0
+        return (x-w,y-h,x+w,y+h)
     
     def _move(self, dx, dy):
         self.anchor.move(dx,dy)
@@ -762,12 +1702,12 @@ class Pixmap:
     def __init__(self, *args):
         if len(args) == 1: # a file name or pixmap
             if type(args[0]) == type(""):
-                self.image = tk.PhotoImage( file=args[0], master=_root)
+                self.image = tk.PhotoImage( file=args[0])
             else:
                 self.image = args[0]
         else: # arguments are width and height
             width, height = args
-            self.image = tk.PhotoImage( master=_root, width=width, height=height)
+            self.image = tk.PhotoImage( width=width, height=height)
     
     def getWidth(self):
         """Returns the width of the image in pixels"""
@@ -787,7 +1727,7 @@ class Pixmap:
         if type(value) ==  int:
             return [value, value, value]
         else:
-            return map(int, value.split()) 
+            return list(map(int, value.split()))
 
  #   def setPixel(self, x, y, int(r,g,b)):
         """Sets pixel (x,y) to the color given by RGB values r, g, and b.
@@ -797,6 +1737,26 @@ class Pixmap:
         
         self.image.put( "{%s}"%color_rgb(r,g,b), (x, y))
 
+    def putRows(self, rows, x=0, y=0):
+        """Sets a block of pixels in one call. rows is a list of rows,
+        each a list of color strings such as "#ff0000"; the top left
+        pixel of the block goes to (x, y)
+
+        """
+        data = " ".join(["{%s}" % " ".join(row) for row in rows])
+        self.image.put(data, to=(x, y))
+
+    def putPPM(self, data):
+        """Replaces the whole image with binary PPM (P6) data, such as
+        b"P6 2 1 255 " followed by 2*1*3 bytes of r,g,b values, in one
+        call. Much faster than putRows for large images
+
+        """
+        if sys.version_info[0] < 3:
+            # Python 2 hands str to Tcl as text; Tk reads base64 too
+            data = base64.b64encode(data)
+        self.image.configure(data=data, format="PPM")
+
     def clone(self):
         """Returns a copy of this Pixmap"""
         return Pixmap(self.image.copy())
@@ -843,6 +1803,136 @@ class Window(tk.Tk):
         """Close the window"""        
         self.destroy()
 
+
+
+class Scheduler:
+
+    """Runs a function on a fixed timestep from the Tk event loop.
+
+    Instead of rescheduling itself with after(delay) once its work is
+    done, which adds the time the work took to every period, the
+    scheduler keeps absolute deadlines: the n-th step is due at
+    start + n * period. When it falls behind it runs several steps in
+    one tick to catch up, at most maxCatchUp of them; deadlines it
+    cannot catch up on are dropped.
+
+    An optional render function runs once every renderPeriod ms (or
+    after every tick that ran a step, if renderPeriod is None), so the
+    simulation rate and the render rate are independent:
+
+       sched = Scheduler(win, board.advance, 50, board.redraw, 200)
+       sched.start()
+
+    Periods are in milliseconds, like after(). The attributes steps,
+    frames, late (steps that ran after their deadline had been missed
+    by a whole period) and dropped (deadlines skipped) report how well
+    the schedule is kept. The clock defaults to the window's clock() if
+    it has one (the virtual clock of a headless window), otherwise to
+    the system's monotonic clock.
+    """
+
+    def __init__(self, win, step, period, render=None, renderPeriod=None,
+                 maxCatchUp=5, clock=None):
+        self.win = win
+        self.step = step
+        self.period = period
+        self.render = render
+        self.renderPeriod = renderPeriod
+        self.maxCatchUp = maxCatchUp
+        # a headless window has its own virtual clock
+        self.clock = (clock or getattr(win, 'clock', None)
+                      or getattr(time, 'monotonic', time.time))
+        self.running = False
+        self.steps = 0
+        self.frames = 0
+        self.late = 0
+        self.dropped = 0
+        self._nextStep = None
+        self._nextRender = None
+        self._afterId = None
+        # True while _tick runs a step
+        self._inStep = False
+
+    def missed(self):
+        """Return the number of deadlines missed so far"""
+        return self.late + self.dropped
+
+    def setPeriod(self, period):
+        """Set the ms between steps, starting from the next step. Called
+        from inside a step, the next step is period ms after the
+        deadline of this one"""
+        if self.running and not self._inStep:
+            # _tick adds the period to the last deadline itself when it
+            # is the one running the step
+            self._nextStep += (period - self.period) / 1000.0
+        self.period = period
+
+    def start(self, delay=0):
+        """Start running, with the first step delay ms from now"""
+        if self.running:
+            return
+        self.running = True
+        now = self.clock()
+        self._nextStep = now + delay / 1000.0
+        self._nextRender = now
+        self._schedule()
+
+    def stop(self):
+        """Stop running; steps that are due are not run"""
+        self.running = False
+        if self._afterId is not None:
+            self.win.after_cancel(self._afterId)
+            self._afterId = None
+
+    def _schedule(self):
+        wake = self._nextStep
+        if self.render and self.renderPeriod is not None:
+            wake = min(wake, self._nextRender)
+        # round up, so the tick does not come early and find nothing due
+        delay = int(math.ceil((wake - self.clock()) * 1000))
+        self._afterId = self.win.after(max(delay, 0), self._tick)
+
+    def _tick(self):
+        self._afterId = None
+        if not self.running:
+            return
+        period = self.period / 1000.0
+        now = self.clock()
+        ran = 0
+        while now >= self._nextStep and ran < self.maxCatchUp:
+            if now - self._nextStep >= period:
+                self.late = self.late + 1
+            self._inStep = True
+            try:
+                self.step()
+            finally:
+                self._inStep = False
+            self.steps = self.steps + 1
+            ran = ran + 1
+            if not self.running:
+                break
+            self._nextStep += self.period / 1000.0
+            period = self.period / 1000.0
+        if self.running and now >= self._nextStep:
+            # too far behind to catch up: drop the missed deadlines
+            behind = int((now - self._nextStep) / period) + 1
+            self.dropped = self.dropped + behind
+            self._nextStep += behind * period
+        if self.render:
+            if self.renderPeriod is None:
+                if ran:
+                    self.render()
+                    self.frames = self.frames + 1
+            elif now >= self._nextRender:
+                self.render()
+                self.frames = self.frames + 1
+                renderPeriod = self.renderPeriod / 1000.0
+                self._nextRender += renderPeriod
+                if self._nextRender <= now:
+                    self._nextRender = now + renderPeriod
+        if self.running:
+            self._schedule()
+
         
 def test():
     
@@ -890,7 +1980,36 @@ def test():
     win.getMouse()
     win.close()
     win.mainloop()
+
+def testScheduler():
+    """Check the spacing of Scheduler steps on the virtual clock of a
+    NullTk, with the period changed from inside a step and from outside
+    of one. Runs without a display:
+
+       python graphics.py scheduler
+    """
+    win = NullTk()
+    times = []
+    def step():
+        times.append(win.clock())
+        if len(times) == 3:
+            sched.setPeriod(500)
+    sched = Scheduler(win, step, 1000)
+    sched.start()
+    win.runFor(4000)
+    gaps = [round(b - a, 3) for a, b in zip(times, times[1:])]
+    assert gaps == [1.0, 1.0, 0.5, 0.5, 0.5, 0.5], gaps
+    sched.setPeriod(2000)
+    win.runFor(4000)
+    gaps = [round(b - a, 3) for a, b in zip(times, times[1:])]
+    assert gaps[6:] == [2.0, 2.0], gaps
+    sched.stop()
+    assert sched.missed() == 0
+    print("scheduler steps at %s" % [round(t, 3) for t in times])
  
 if __name__ == "__main__":
     
-    test()
+    if sys.argv[1:] == ["scheduler"]:
+        testScheduler()
+    else:
+        test()
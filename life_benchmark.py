@@ -0,0 +1,373 @@
+'''
+Benchmarks for the Game of Life engines.
+
+Runs every engine on the patterns from game_of_life.py and on random
+soups, without opening a window, and prints the results as JSON so they
+can be compared across commits:
+
+    python life_benchmark.py --sizes 64 256 --output bench.json
+
+For every engine, pattern and board size it records generations per
+second, the per-generation latency percentiles and the peak memory.
+The 'reference' engine runs the original Board.simulate rules and is
+the baseline for the 'speedup' field.
+
+With --board blocks (or image) every run goes through Board.simulate
+instead of engine.step, so drawing and cycle detection are timed too.
+The board is drawn with the headless graphics backend, so no display
+is needed:
+
+    python life_benchmark.py --sizes 64 --board blocks
+
+With --check nothing is timed: every engine is stepped through the same
+generations under several Life-like rules, in jumps as well as one at a
+time, and its live squares are compared with those of the first engine
+that shares its boundary. Any difference is reported and the exit
+status is 1. The check runs on small boards (CHECK_SIZES) unless
+--sizes is given, since every size runs through every rule:
+
+    python life_benchmark.py --check
+'''
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+# never open a window, even when a display is available
+os.environ.setdefault('GRAPHICS_BACKEND', 'null')
+
+from graphics import Window
+from game_of_life import (Board, glider_blocklist, pulsar_blocklist, diehard_blocklist,
+                          beacon_blocklist, toad_blocklist)
+from life_engine import (ReferenceEngine, NumpyEngine, SparseEngine,
+                         HashLifeEngine, BitEngine, ParallelEngine, Rule, CONWAY)
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2: fall back to the peak resident size of the whole process
+    tracemalloc = None
+    import resource
+
+
+PATTERNS = {
+    'glider': glider_blocklist,
+    'pulsar': pulsar_blocklist,
+    'diehard': diehard_blocklist,
+    'beacon': beacon_blocklist,
+    'toad': toad_blocklist,
+}
+
+# densities for the random soups, as passed to Board.random_seed
+SOUP_DENSITIES = [0.1, 0.3, 0.5]
+
+# every engine is made with (size, boundary, rule); a boundary of None
+# gives the engine's own default
+ENGINES = {
+    'reference': lambda size, boundary, rule: ReferenceEngine(size, size),
+    'numpy': lambda size, boundary, rule: NumpyEngine(
+        size, size, boundary or 'bounded', rule),
+    'bit': lambda size, boundary, rule: BitEngine(
+        size, size, boundary or 'bounded', rule),
+    'sparse': lambda size, boundary, rule: SparseEngine(size, size, boundary, rule),
+    'hashlife': lambda size, boundary, rule: HashLifeEngine(rule=rule),
+    'parallel': lambda size, boundary, rule: ParallelEngine(
+        size, size, boundary=boundary or 'bounded', rule=rule),
+}
+
+# the boundaries each engine can run with
+ENGINE_BOUNDARIES = {
+    'reference': ReferenceEngine.BOUNDARIES,
+    'numpy': NumpyEngine.BOUNDARIES,
+    'bit': BitEngine.BOUNDARIES,
+    'sparse': SparseEngine.BOUNDARIES,
+    'hashlife': HashLifeEngine.BOUNDARIES,
+    'parallel': ParallelEngine.BOUNDARIES,
+}
+
+DEFAULT_ENGINES = ['reference', 'numpy', 'bit', 'sparse', 'hashlife']
+
+DEFAULT_SIZES = [64, 256, 1024]
+
+# rules for --check: Conway, rules that grow at one square per generation
+# (B1, B2), rules with no survival or survival on 0 neighbours, and a
+# rule with births on 0 that only the dense engines run
+CHECK_RULES = ['B3/S23', 'B36/S23', 'B2/S', 'B2/S0', 'B1/S1', 'B1357/S1357',
+               'B3678/S34678', 'B0123478/S34678']
+
+# board sizes for --check without --sizes; small, so the pure Python
+# reference engine gets through every rule in seconds
+CHECK_SIZES = [16, 32]
+
+# generations for --check, stepped in turn: single steps and jumps of a
+# power of two and of a sum of them
+CHECK_STEPS = [1, 1, 4, 16, 11]
+
+
+def pattern_cells(name, size, rng):
+    ''' Returns the list of (x, y) squares to seed for a pattern name on a
+        size x size board. Patterns are moved to the middle of the board.
+    '''
+    if name in PATTERNS:
+        offset = size // 2 - 8
+        return [(x + offset, y + offset) for x, y in PATTERNS[name]]
+    density = float(name.split('-')[1])
+    ys, xs = np.nonzero(rng.random_sample((size, size)) < density)
+    return list(zip(xs.tolist(), ys.tolist()))
+
+
+def percentile(values, p):
+    ''' Returns the p-th percentile (0 to 100) of a sorted list.
+    '''
+    if not values:
+        return None
+    index = min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def milliseconds(seconds):
+    ''' Returns seconds in milliseconds, or None if seconds is None (no
+        generation ran), which the JSON report shows as null.
+    '''
+    if seconds is None:
+        return None
+    return seconds * 1000
+
+
+def peak_memory_start():
+    if tracemalloc is not None:
+        tracemalloc.start()
+
+
+def peak_memory_stop():
+    ''' Returns (bytes, method) for the peak memory since peak_memory_start.
+    '''
+    if tracemalloc is not None:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak, 'tracemalloc'
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, 'process_max_rss'
+
+
+def run_one(engine_name, pattern, size, boundary, rule, generations,
+            time_limit, seed, board=None):
+    ''' Runs one engine on one pattern and returns a dictionary of results.
+        Stops early once time_limit seconds of stepping have been spent.
+        If board is 'blocks' or 'image', the engine runs inside a
+        headless Board with that renderer and every generation is a
+        Board.simulate.
+    '''
+    rng = np.random.RandomState(seed)
+    random.seed(seed)
+    cells = pattern_cells(pattern, size, rng)
+
+    peak_memory_start()
+    engine = ENGINES[engine_name](size, boundary, rule)
+    if board:
+        game = Board(Window('benchmark'), size, size, engine=engine,
+                     renderer=board)
+        game.seed(cells)
+        step = game.simulate
+    else:
+        engine.seed(cells)
+        step = engine.step
+    latencies = []
+    total = 0.0
+    try:
+        while len(latencies) < generations and total < time_limit:
+            start = time.time()
+            step()
+            elapsed = time.time() - start
+            latencies.append(elapsed)
+            total += elapsed
+        population = engine.population()
+    finally:
+        if hasattr(engine, 'close'):
+            engine.close()
+    peak, method = peak_memory_stop()
+
+    latencies.sort()
+    return {
+        'engine': engine_name,
+        'board': board,
+        'pattern': pattern,
+        'size': size,
+        'boundary': engine.boundary,
+        'rule': str(rule),
+        'generations': len(latencies),
+        'seconds': total,
+        'generations_per_sec': len(latencies) / total if total else None,
+        'latency_p50_ms': milliseconds(percentile(latencies, 50)),
+        'latency_p90_ms': milliseconds(percentile(latencies, 90)),
+        'latency_p99_ms': milliseconds(percentile(latencies, 99)),
+        'latency_max_ms': milliseconds(latencies[-1] if latencies else None),
+        'peak_memory_bytes': peak,
+        'memory_method': method,
+        'final_population': population,
+    }
+
+
+def git_commit():
+    ''' Returns the current git commit, or None outside of a git checkout.
+    '''
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                         stderr=subprocess.STDOUT,
+                                         cwd=os.path.dirname(os.path.abspath(__file__)))
+        return output.decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(engines, patterns, sizes, boundary, rule, generations, time_limit, seed,
+        board=None):
+    ''' Runs every combination and returns the full report as a dictionary.
+        Engines that do not support the boundary or rule are skipped.
+    '''
+    rule = Rule(rule)
+    skipped = [name for name in engines
+               if boundary is not None and boundary not in ENGINE_BOUNDARIES[name]]
+    for name in skipped:
+        sys.stderr.write('skipping %s: no %s boundary\n' % (name, boundary))
+    if rule != CONWAY and 'reference' in engines:
+        # the reference engine only knows Conway's rule
+        skipped.append('reference')
+        sys.stderr.write('skipping reference: no %s rule\n' % rule)
+    if 0 in rule.birth:
+        for name in ('sparse', 'hashlife'):
+            if name in engines and name not in skipped:
+                skipped.append(name)
+                sys.stderr.write('skipping %s: no B0 rules\n' % name)
+    engines = [name for name in engines if name not in skipped]
+    results = []
+    for size in sizes:
+        for pattern in patterns:
+            baseline = None
+            for engine_name in engines:
+                result = run_one(engine_name, pattern, size, boundary, rule,
+                                 generations, time_limit, seed, board)
+                if engine_name == 'reference':
+                    baseline = result['generations_per_sec']
+                results.append(result)
+                sys.stderr.write('%-10s %-10s %5d  %10.1f gen/s\n'
+                                 % (engine_name, pattern, size,
+                                    result['generations_per_sec'] or 0))
+            for result in results:
+                if (result['size'] == size and result['pattern'] == pattern
+                        and baseline and result['generations_per_sec']):
+                    result['speedup'] = result['generations_per_sec'] / baseline
+    return {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'settings': {'generations': generations, 'time_limit': time_limit,
+                     'seed': seed, 'boundary': boundary, 'rule': str(rule),
+                     'board': board},
+        'skipped': skipped,
+        'results': results,
+    }
+
+
+def check(engines, patterns, sizes, rules, seed):
+    ''' Steps every engine through CHECK_STEPS under every rule and
+        returns the list of (rule, boundary, pattern, size, engine,
+        generation) at which an engine's live squares differ from those
+        of the first engine with the same boundary. An empty list means
+        the engines agree.
+    '''
+    failures = []
+    for rule in rules:
+        rule = Rule(rule)
+        for boundary in ('bounded', 'toroidal', 'infinite'):
+            names = [name for name in engines
+                     if boundary in ENGINE_BOUNDARIES[name]
+                     and (name != 'reference' or rule == CONWAY)
+                     and (0 not in rule.birth or name not in ('sparse', 'hashlife'))]
+            if len(names) < 2:
+                continue
+            for size in sizes:
+                for pattern in patterns:
+                    cells = pattern_cells(pattern, size, np.random.RandomState(seed))
+                    runs = [ENGINES[name](size, boundary, rule) for name in names]
+                    try:
+                        for engine in runs:
+                            engine.seed(cells)
+                        generation = 0
+                        for generations in CHECK_STEPS:
+                            generation += generations
+                            for engine in runs:
+                                engine.step(generations)
+                            expected = sorted(runs[0].live_cells())
+                            for name, engine in zip(names[1:], runs[1:]):
+                                if sorted(engine.live_cells()) != expected:
+                                    failures.append((str(rule), boundary, pattern,
+                                                     size, name, generation))
+                    finally:
+                        for engine in runs:
+                            if hasattr(engine, 'close'):
+                                engine.close()
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Game of Life engines.')
+    parser.add_argument('--engines', nargs='+', default=DEFAULT_ENGINES,
+                        choices=sorted(ENGINES))
+    parser.add_argument('--patterns', nargs='+',
+                        default=sorted(PATTERNS) + ['soup-%s' % d for d in SOUP_DENSITIES])
+    parser.add_argument('--sizes', nargs='+', type=int,
+                        help='board sizes (default: %s, or %s with --check)'
+                             % (' '.join(map(str, DEFAULT_SIZES)),
+                                ' '.join(map(str, CHECK_SIZES))))
+    parser.add_argument('--boundary', choices=['bounded', 'toroidal', 'infinite'],
+                        help="default: each engine's own, which is bounded "
+                             "except for hashlife")
+    parser.add_argument('--rule', default='B3/S23',
+                        help="Life-like rule, e.g. B36/S23 or highlife")
+    parser.add_argument('--generations', type=int, default=100,
+                        help='generations per run')
+    parser.add_argument('--time-limit', type=float, default=10.0,
+                        help='seconds of stepping after which a run stops')
+    parser.add_argument('--seed', type=int, default=1,
+                        help='random seed for the soups')
+    parser.add_argument('--board', choices=['blocks', 'image'],
+                        help='time Board.simulate with this renderer, drawn '
+                             'headless, instead of engine.step')
+    parser.add_argument('--output', help='file for the JSON report (default: stdout)')
+    parser.add_argument('--check', action='store_true',
+                        help='compare the live squares of the engines under '
+                             'several rules instead of timing them')
+    args = parser.parse_args(argv)
+
+    if args.check:
+        failures = check(args.engines, args.patterns, args.sizes or CHECK_SIZES,
+                         CHECK_RULES, args.seed)
+        for failure in failures:
+            sys.stderr.write('%s %s %s %d: %s differs at generation %d\n'
+                             % failure)
+        sys.stderr.write('%d differences\n' % len(failures))
+        sys.exit(1 if failures else 0)
+
+    report = run(args.engines, args.patterns, args.sizes or DEFAULT_SIZES,
+                 args.boundary, args.rule, args.generations, args.time_limit,
+                 args.seed, args.board)
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,268 @@
+'''
+Binary checkpoints for long Game of Life runs.
+
+A checkpoint holds the generation number, the rule, the boundary and
+size of the board and the live squares of an engine packed 8 to a byte:
+
+    write_checkpoint('run.ckpt', engine)
+    engine = restore_checkpoint('run.ckpt')
+
+The packed rows start at a fixed, aligned offset after the header, so
+read_checkpoint can hand them out as a numpy.memmap and a resumed board
+is read straight from the page cache instead of being parsed. A
+CheckpointWriter packs and writes checkpoints on a background thread so
+the stepping loop only pays for engine.snapshot().
+'''
+
+import os
+import struct
+import threading
+
+import numpy as np
+
+from life_engine import NumpyEngine, SparseEngine, Rule
+
+
+MAGIC = b'LIFECKP2'
+
+# magic, generation, width and height of the board (-1 for unbounded
+# boards), x0, y0, width and height of the packed area, length of the
+# rule and of the boundary; the two strings follow the header
+_HEADER = struct.Struct('<8sqqqqqqqHH')
+
+# the packed rows start at a multiple of this many bytes
+_ALIGN = 64
+
+
+############################################################
+# READING AND WRITING
+############################################################
+
+
+class Checkpoint(object):
+    ''' Checkpoint class: the contents of a checkpoint file
+        Attributes: generation - type:int
+                    rule - type:Rule
+                    boundary - type:string
+                    board_width, board_height - type:int - size of the
+                    board, None for infinite boards
+                    x0, y0 - type:int - where rows[0] starts on the board
+                    width, height - type:int - size of the packed area
+                    rows - type:numpy.ndarray - (height, (width + 7) // 8)
+                    uint8 array of packed rows, see LifeEngine.packed_snapshot
+    '''
+
+    def __init__(self, generation, rule, boundary, board_width, board_height,
+                 x0, y0, width, height, rows):
+        self.generation = generation
+        self.rule = Rule(rule)
+        self.boundary = boundary
+        self.board_width = board_width
+        self.board_height = board_height
+        self.x0 = x0
+        self.y0 = y0
+        self.width = width
+        self.height = height
+        self.rows = rows
+
+
+def _replace(src, dst):
+    ''' Renames src to dst, replacing dst if it exists.
+    '''
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    else:
+        # Python 2: rename replaces an existing file on POSIX only
+        if os.name == 'nt' and os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+
+def _write(path, generation, rule, boundary, board_size, packed):
+    ''' Writes a checkpoint from the (width, height) of the board and the
+        result of packed_snapshot. The file is written next to path and
+        renamed over it, so a crash mid-write leaves the previous
+        checkpoint intact.
+    '''
+    x0, y0, width, height, rows = packed
+    if boundary == 'infinite' or None in board_size:
+        board_size = (-1, -1)
+    rule = str(rule).encode('ascii')
+    boundary = boundary.encode('ascii')
+    header = _HEADER.pack(MAGIC, generation, board_size[0], board_size[1],
+                          x0, y0, width, height,
+                          len(rule), len(boundary)) + rule + boundary
+    header += b'\0' * (-len(header) % _ALIGN)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(header)
+        f.write(np.ascontiguousarray(rows, dtype=np.uint8).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    _replace(tmp, path)
+
+
+def write_checkpoint(path, engine, snapshot=None):
+    ''' Parameters: path - type:string - the checkpoint file
+                    engine - type:LifeEngine
+                    snapshot - a snapshot of the engine (default: now)
+
+        Writes a checkpoint of the engine and waits for it to finish.
+    '''
+    if snapshot is None:
+        snapshot = engine.snapshot()
+    _write(path, engine.generation, engine.rule, engine.boundary,
+           (engine.width, engine.height), engine.packed_snapshot(snapshot))
+
+
+def read_checkpoint(path):
+    ''' Parameters: path - type:string - the checkpoint file
+
+        Returns a Checkpoint whose rows are memory-mapped from the file,
+        so nothing past the header is read until the rows are used.
+    '''
+    with open(path, 'rb') as f:
+        data = f.read(_HEADER.size)
+        if len(data) < _HEADER.size or data[:len(MAGIC)] != MAGIC:
+            raise ValueError("%s is not a Game of Life checkpoint" % path)
+        (magic, generation, board_width, board_height, x0, y0, width, height,
+         rule_length, boundary_length) = _HEADER.unpack(data)
+        rule = f.read(rule_length).decode('ascii')
+        boundary = f.read(boundary_length).decode('ascii')
+    offset = _HEADER.size + rule_length + boundary_length
+    offset += -offset % _ALIGN
+    shape = (height, (width + 7) // 8)
+    if height and shape[1]:
+        rows = np.memmap(path, dtype=np.uint8, mode='r', offset=offset,
+                         shape=shape)
+    else:
+        rows = np.zeros(shape, dtype=np.uint8)
+    if board_width < 0:
+        board_width = board_height = None
+    return Checkpoint(generation, rule, boundary, board_width, board_height,
+                      x0, y0, width, height, rows)
+
+
+def restore_checkpoint(path, engine=None):
+    ''' Parameters: path - type:string - the checkpoint file
+                    engine - type:LifeEngine - engine to restore into
+                    (default: a new NumpyEngine, or a SparseEngine for
+                    infinite boards)
+
+        Replaces the board of the engine with the checkpoint and sets its
+        generation, then returns the engine. Raises ValueError if the
+        engine runs a different rule than the checkpoint.
+    '''
+    checkpoint = read_checkpoint(path)
+    if engine is None:
+        if checkpoint.boundary == 'infinite':
+            engine = SparseEngine(rule=checkpoint.rule)
+        else:
+            engine = NumpyEngine(checkpoint.board_width, checkpoint.board_height,
+                                 checkpoint.boundary, checkpoint.rule)
+    elif engine.rule != checkpoint.rule:
+        raise ValueError("checkpoint %s is for rule %s, not %s"
+                         % (path, checkpoint.rule, engine.rule))
+    engine.clear()
+    engine.load_packed(checkpoint.rows, checkpoint.width,
+                       checkpoint.x0, checkpoint.y0)
+    engine.generation = checkpoint.generation
+    return engine
+
+
+############################################################
+# BACKGROUND WRITER
+############################################################
+
+
+class CheckpointWriter(object):
+    ''' CheckpointWriter class:
+        Writes checkpoints on a background thread. write() only takes a
+        snapshot of the engine; packing and writing happen on the thread.
+        If a checkpoint is still being written when the next one comes
+        in, only the newest waiting checkpoint is kept. The thread is not
+        a daemon, so the program waits for a write in progress before
+        exiting. A failed write (IOError or OSError) is recorded in error
+        and the thread carries on; any other exception stops the thread
+        and is raised again by the next write() or close().
+        Attributes: written - type:int - number of checkpoints written
+                    dropped - type:int - number of checkpoints replaced by a
+                    newer one before they were written
+                    error - type:Exception - the last write error, or None
+    '''
+
+    def __init__(self):
+        self.written = 0
+        self.dropped = 0
+        self.error = None
+        self._lock = threading.Lock()
+        self._pending = None
+        self._thread = None
+        # the exception that stopped the thread, until it is raised again
+        self._failure = None
+
+    def write(self, path, engine):
+        ''' Parameters: path - type:string - the checkpoint file
+                        engine - type:LifeEngine
+
+            Queues a checkpoint of the engine as it is now. Raises the
+            exception that stopped the thread, if one did.
+        '''
+        self._raise_failure()
+        job = (path, engine, engine.snapshot(), engine.generation,
+               engine.rule, engine.boundary, (engine.width, engine.height))
+        with self._lock:
+            if self._pending is not None:
+                self.dropped += 1
+            self._pending = job
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.start()
+
+    def _run(self):
+        try:
+            while True:
+                with self._lock:
+                    job = self._pending
+                    self._pending = None
+                    if job is None:
+                        self._thread = None
+                        return
+                path, engine, snapshot, generation, rule, boundary, size = job
+                try:
+                    _write(path, generation, rule, boundary, size,
+                           engine.packed_snapshot(snapshot))
+                    self.written += 1
+                except (IOError, OSError) as e:
+                    self.error = e
+        except Exception as e:
+            self.error = self._failure = e
+            raise
+        finally:
+            with self._lock:
+                # a write() after the normal return may have started
+                # another thread already
+                if self._thread is threading.current_thread():
+                    self._thread = None
+
+    def _raise_failure(self):
+        with self._lock:
+            failure = self._failure
+            self._failure = None
+        if failure is not None:
+            raise failure
+
+    def wait(self):
+        ''' Waits until every queued checkpoint has been written.
+        '''
+        with self._lock:
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def close(self):
+        ''' Waits until every queued checkpoint has been written, then
+            raises the exception that stopped the thread, if one did.
+        '''
+        self.wait()
+        self._raise_failure()
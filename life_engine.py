@@ -0,0 +1,1613 @@
+'''
+Display-free engines for Conway's Game of Life and other Life-like rules.
+
+An engine owns the state of a Game of Life board and knows how to
+advance it. game_of_life.Board is only a view over an engine: it asks
+the engine for the next generation and draws the result, so the rules
+can run on boards far larger than anything Tk can display.
+'''
+
+import multiprocessing
+import random
+import re
+import threading
+import time
+from binascii import hexlify, unhexlify
+from collections import defaultdict, deque
+
+import numpy as np
+
+try:
+    import queue
+except ImportError:
+    # Python 2
+    import Queue as queue
+
+# (dx, dy) offsets of the 8 neighbours of a square
+NEIGHBOR_OFFSETS = [(-1, -1), (0, -1), (1, -1),
+                    (-1, 0), (1, 0),
+                    (-1, 1), (0, 1), (1, 1)]
+
+
+############################################################
+# RULES
+############################################################
+
+# well known Life-like rules, by name
+RULES = {
+    'life': 'B3/S23',
+    'highlife': 'B36/S23',
+    'seeds': 'B2/S',
+    'daynight': 'B3678/S34678',
+    'lifewithoutdeath': 'B3/S012345678',
+    'replicator': 'B1357/S1357',
+}
+
+
+class Rule(object):
+    ''' Rule class:
+        A Life-like rule in B/S notation: 'B3/S23' means a dead square with
+        3 live neighbours is born, and a live square with 2 or 3 survives.
+        S/B notation ('23/3') and the names in RULES are accepted too.
+        The rule is compiled once into lookup tables.
+        Attributes: birth - type:frozenset - neighbour counts giving birth
+                    survival - type:frozenset - neighbour counts to survive
+                    table - type:bytearray - 512 entries, the next state of a
+                    square for every 3x3 neighbourhood. Bit (dy+1)*3 + (dx+1)
+                    of the index is the square at offset (dx, dy), so bit 4
+                    is the square itself
+                    state_table - type:bytearray - 18 entries, the next state
+                    for index (neighbour count << 1) | current state
+    '''
+
+    def __init__(self, rule='B3/S23'):
+        if isinstance(rule, Rule):
+            rule = str(rule)
+        text = RULES.get(rule.lower(), rule).upper().replace(' ', '')
+        match = re.match(r'^B([0-8]*)/S([0-8]*)$', text)
+        if match:
+            birth, survival = match.groups()
+        else:
+            match = (re.match(r'^S([0-8]*)/B([0-8]*)$', text) or
+                     re.match(r'^([0-8]*)/([0-8]*)$', text))
+            if not match:
+                raise ValueError("not a Life-like rule: %r" % rule)
+            survival, birth = match.groups()
+        self.birth = frozenset(int(n) for n in birth)
+        self.survival = frozenset(int(n) for n in survival)
+
+        self.state_table = bytearray(18)
+        for count in range(9):
+            self.state_table[count << 1] = count in self.birth
+            self.state_table[(count << 1) | 1] = count in self.survival
+        self.table = bytearray(512)
+        for index in range(512):
+            alive = (index >> 4) & 1
+            count = bin(index & ~16).count('1')
+            self.table[index] = self.state_table[(count << 1) | alive]
+        self.state_array = np.array(list(self.state_table), dtype=np.uint8)
+
+    def __str__(self):
+        return 'B%s/S%s' % (''.join(map(str, sorted(self.birth))),
+                            ''.join(map(str, sorted(self.survival))))
+
+    def __repr__(self):
+        return 'Rule(%r)' % str(self)
+
+    def __eq__(self, other):
+        return (isinstance(other, Rule) and self.birth == other.birth
+                and self.survival == other.survival)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.birth, self.survival))
+
+    def next_state(self, alive, count):
+        ''' Returns 1 if a square with the given state (0 or 1) and number
+            of live neighbours is live next generation, otherwise 0.
+        '''
+        return self.state_table[(count << 1) | alive]
+
+
+CONWAY = Rule('B3/S23')
+
+
+############################################################
+# ENGINE BASE CLASS
+############################################################
+
+
+# number of packed rows load_packed unpacks at a time
+PACKED_SLAB = 1024
+
+
+def expand_runs(ys, xs, lengths):
+    ''' Returns (ys, xs): arrays with one entry per square of the given
+        horizontal runs.
+    '''
+    starts = np.cumsum(lengths) - lengths
+    offsets = np.arange(int(lengths.sum())) - np.repeat(starts, lengths)
+    return np.repeat(ys, lengths), np.repeat(xs, lengths) + offsets
+
+
+class LifeEngine(object):
+    ''' LifeEngine class:
+        Base class for all the Game of Life engines
+        Attributes: width - type:int - width of the board in squares
+                    height - type:int - height of the board in squares
+                    generation - type:int - number of generations simulated
+                    boundary - type:string - what lies past the edges:
+                    'bounded' (dead squares), 'toroidal' (the opposite edge)
+                    or 'infinite' (more board)
+                    rule - type:Rule - the rule the board evolves by
+                    BOUNDARIES - type:tuple - the boundaries an engine supports
+    '''
+
+    BOUNDARIES = ('bounded',)
+
+    def __init__(self, width, height, boundary='bounded', rule=CONWAY):
+        if boundary not in self.BOUNDARIES:
+            raise ValueError("%s does not support the %r boundary, only %s"
+                             % (type(self).__name__, boundary,
+                                ', '.join(self.BOUNDARIES)))
+        self.width = width
+        self.height = height
+        self.boundary = boundary
+        self.rule = Rule(rule)
+        self.generation = 0
+
+    def _check_no_b0(self):
+        ''' Raises ValueError for rules where squares with no live neighbours
+            are born, which engines that only visit the live squares and
+            their neighbours cannot run.
+        '''
+        if 0 in self.rule.birth:
+            raise ValueError("%s cannot run B0 rules like %s"
+                             % (type(self).__name__, self.rule))
+
+    def in_bounds(self, x, y):
+        ''' Returns True if the square (x, y) is on the board.
+        '''
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def seed(self, block_coords):
+        ''' Parameters: block_coords - a list of (x, y) tuples
+
+            Sets the squares at the given coordinates live. Coordinates
+            outside of the board are ignored.
+        '''
+        for x, y in block_coords:
+            if self.in_bounds(x, y):
+                self.set_live(x, y)
+
+    def seed_runs(self, ys, xs, lengths):
+        ''' Parameters: ys, xs, lengths - type:numpy.ndarray - one entry per
+                        horizontal run of live squares, starting at (x, y)
+
+            Sets the squares of every run live, like seed but without a
+            list of tuples. Squares outside of the board are ignored.
+        '''
+        ys, xs = expand_runs(ys, xs, lengths)
+        self.seed(zip(xs.tolist(), ys.tolist()))
+
+    def random_seed(self, percentage):
+        ''' Parameters: percentage - a number between 0 and 1 representing the
+                                     percentage of the board to be filled
+
+            Sets the specified percentage of squares live at random.
+        '''
+        for y in range(self.height):
+            for x in range(self.width):
+                if random.random() < percentage:
+                    self.set_live(x, y)
+
+    def population(self):
+        ''' Returns the number of live squares.
+        '''
+        return len(self.live_cells())
+
+    def packed_snapshot(self, snapshot):
+        ''' Parameters: snapshot - a snapshot of this engine
+
+            Returns (x0, y0, width, height, rows) for the area of the
+            snapshot that holds its live squares: rows is a (height,
+            (width + 7) // 8) uint8 array with every row packed by
+            np.packbits, so the square (x0 + x, y0 + y) is bit 7 - x % 8
+            of rows[y, x // 8]. Safe to call from another thread.
+        '''
+        if not snapshot:
+            return 0, 0, 0, 0, np.zeros((0, 0), dtype=np.uint8)
+        cells = np.array(list(snapshot), dtype=np.int64)
+        x0, y0 = cells.min(axis=0)
+        width, height = cells.max(axis=0) - (x0, y0) + 1
+        grid = np.zeros((height, width), dtype=np.uint8)
+        grid[cells[:, 1] - y0, cells[:, 0] - x0] = 1
+        return int(x0), int(y0), int(width), int(height), np.packbits(grid, axis=1)
+
+    def region(self, snapshot, x0, y0, width, height, shrink=1):
+        ''' Parameters: snapshot - a snapshot of this engine
+                        x0, y0 - type:int - top left square of an area
+                        width, height - type:int - size of the result
+                        shrink - type:int - squares per element across
+
+            Returns a (height, width) uint8 array for the area of the
+            snapshot starting at (x0, y0): element [y, x] is 1 if any
+            square of the shrink x shrink block starting at
+            (x0 + x * shrink, y0 + y * shrink) is live, else 0. Squares off
+            the board are dead. Used to draw part of a board as an image.
+        '''
+        area = np.zeros((height, width), dtype=np.uint8)
+        for x, y in snapshot:
+            x = (x - x0) // shrink
+            y = (y - y0) // shrink
+            if 0 <= x < width and 0 <= y < height:
+                area[y, x] = 1
+        return area
+
+    def load_packed(self, rows, width, x0=0, y0=0):
+        ''' Parameters: rows - type:numpy.ndarray - rows packed like those
+                        of packed_snapshot; may be a numpy.memmap
+                        width - type:int - number of squares in every row
+                        x0, y0 - type:int - where rows[0] starts
+
+            Sets the live squares of the packed rows live. Squares outside
+            of the board are ignored. Reads the rows a slab at a time, so
+            a memory-mapped file is never loaded all at once.
+        '''
+        for start in range(0, len(rows), PACKED_SLAB):
+            ys, xs = np.nonzero(
+                np.unpackbits(rows[start:start + PACKED_SLAB], axis=1)[:, :width])
+            self.seed_runs(ys + (y0 + start), xs + x0,
+                           np.ones(len(ys), dtype=np.int64))
+
+    def snapshot(self):
+        ''' Returns a copy of the current generation that later changes
+            to the engine do not affect. Pass two snapshots to changed_cells.
+        '''
+        return frozenset(self.live_cells())
+
+    def changed_cells(self, prev, next):
+        ''' Parameters: prev - a snapshot of the previous generation
+                        next - a snapshot of the next generation
+            Return value: type: tuple
+
+            Returns (born, died): two lists of (x, y) tuples of the squares
+            that became live and the squares that became dead.
+        '''
+        return list(next - prev), list(prev - next)
+
+    def step(self, generations=1):
+        ''' Parameters: generations - type:int
+
+            Advances the board by the given number of generations.
+        '''
+        for i in range(generations):
+            self._step()
+            self.generation += 1
+
+    def set_live(self, x, y):
+        raise NotImplementedError
+
+    def set_dead(self, x, y):
+        raise NotImplementedError
+
+    def is_live(self, x, y):
+        raise NotImplementedError
+
+    def live_cells(self):
+        ''' Returns a list of (x, y) tuples of all the live squares.
+        '''
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def _step(self):
+        ''' Executes exactly one generation. Must override in subclass.
+        '''
+        raise NotImplementedError
+
+
+############################################################
+# CYCLE DETECTION
+############################################################
+
+
+class CycleDetector(object):
+    ''' CycleDetector class:
+        Recognizes when a board has settled into a still life, an
+        oscillator or extinction. The board is hashed with Zobrist hashing:
+        every square has a random 64 bit key and the hash is the XOR of the
+        keys of the live squares, so it is updated from the squares that
+        were born and died only, at almost no cost per generation.
+        The hashes of the last `history` generations are remembered; a
+        generation whose hash was seen before has repeated.
+        Attributes: history - type:int - number of generations remembered,
+                    i.e. the longest period that can be detected
+                    kind - type:string - None while the board is changing,
+                    otherwise 'extinct', 'still' or 'oscillator'
+                    period - type:int - the period of the repetition, or None
+    '''
+
+    def __init__(self, history=64, seed=0):
+        self.history = history
+        self._random = random.Random(seed)
+        self._keys = {}
+        self.reset()
+
+    def reset(self, live_cells=(), generation=0):
+        ''' Forgets every generation seen so far and starts over from a
+            board with the given live squares.
+        '''
+        self.hash = 0
+        for coord in live_cells:
+            self.hash ^= self._key(coord)
+        self.population = len(live_cells)
+        self.generation = generation
+        self.kind = None
+        self.period = None
+        self._seen = {}
+        self._order = deque()
+        self._remember()
+
+    def _key(self, coord):
+        key = self._keys.get(coord)
+        if key is None:
+            key = self._keys[coord] = self._random.getrandbits(64)
+        return key
+
+    def _remember(self):
+        self._seen[self.hash] = self.generation
+        self._order.append((self.hash, self.generation))
+        if len(self._order) > self.history:
+            old_hash, old_generation = self._order.popleft()
+            if self._seen.get(old_hash) == old_generation:
+                del self._seen[old_hash]
+
+    def update(self, born, died, generation):
+        ''' Parameters: born - list of (x, y) squares that became live
+                        died - list of (x, y) squares that became dead
+                        generation - type:int - the new generation number
+            Return value: type: int
+
+            Updates the hash to the new generation and returns the period
+            if the board is repeating, or None.
+        '''
+        key = self._key
+        h = self.hash
+        for coord in born:
+            h ^= key(coord)
+        for coord in died:
+            h ^= key(coord)
+        self.hash = h
+        self.population += len(born) - len(died)
+        self.generation = generation
+
+        previous = self._seen.get(h)
+        if self.population == 0:
+            self.kind = 'extinct'
+            self.period = 1
+        elif previous is not None:
+            self.period = generation - previous
+            if self.period == 1:
+                self.kind = 'still'
+            else:
+                self.kind = 'oscillator'
+        else:
+            self.kind = None
+            self.period = None
+        self._remember()
+        return self.period
+
+
+############################################################
+# BACKGROUND SIMULATION
+############################################################
+
+
+class SimulationThread(object):
+    ''' SimulationThread class:
+        Steps an engine on a worker thread, so a slow generation never
+        blocks the caller, e.g. the Tk main loop. After every generation
+        the thread puts a (generation, snapshot, info) frame in a bounded
+        queue, info being what on_generation returned; when the queue is
+        full the oldest frame is dropped, so a display that cannot keep up
+        skips generations instead of falling behind. The display takes the
+        newest frame with latest().
+        While the thread runs, no other thread may use the engine: changes
+        to the board are sent to the thread with edit() and made between
+        two generations.
+        Attributes: engine - type:LifeEngine - the engine being stepped
+                    delay - type:float - seconds between generations, kept
+                    on absolute deadlines (0: as fast as possible)
+                    on_generation - called on the worker thread with the
+                    (born, died) lists after every generation, or None;
+                    what it returns goes in the frame
+                    produced - type:int - number of frames produced
+                    dropped - type:int - number of frames never displayed
+                    error - type:Exception - what stopped the thread, or None
+    '''
+
+    def __init__(self, engine, delay=0, queue_size=2, on_generation=None):
+        self.engine = engine
+        self.delay = delay
+        self.on_generation = on_generation
+        self.produced = 0
+        self.dropped = 0
+        self.error = None
+        self.frames = queue.Queue(queue_size)
+        self._edits = queue.Queue()
+        self._stop = threading.Event()
+        # set to end a wait between generations early
+        self._wake = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        ''' Starts stepping the engine.
+        '''
+        if self.running:
+            return
+        self._stop.clear()
+        self._wake.clear()
+        self._thread = threading.Thread(target=self._run)
+        # do not keep the program alive once the window is closed
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, wait=True):
+        ''' Asks the thread to stop after the current generation and, if
+            wait is True, waits until it has and then makes the edits
+            still queued, so none is lost.
+        '''
+        self._stop.set()
+        self._wake.set()
+        thread = self._thread
+        if wait and thread is not None and thread is not threading.current_thread():
+            thread.join()
+            self._apply_edits()
+
+    def edit(self, change):
+        ''' Parameters: change - a function of the engine
+
+            Queues change to be called with the engine on the worker
+            thread, between two generations. The thread then puts a frame
+            of the changed board in the queue, with what change returned
+            as its info.
+        '''
+        self._edits.put(change)
+        self._wake.set()
+
+    def _apply_edits(self):
+        ''' Makes the queued edits and returns a frame of the board after
+            them, or None if there were none.
+        '''
+        info = None
+        edited = False
+        while True:
+            try:
+                change = self._edits.get_nowait()
+            except queue.Empty:
+                break
+            info = change(self.engine)
+            edited = True
+        if not edited:
+            return None
+        return (self.engine.generation, self.engine.snapshot(), info)
+
+    def latest(self):
+        ''' Returns the newest (generation, snapshot, info) frame, or None
+            if no frame was produced since the last call. Older frames
+            waiting in the queue are dropped.
+        '''
+        frame = None
+        while True:
+            try:
+                newer = self.frames.get_nowait()
+            except queue.Empty:
+                return frame
+            if frame is not None:
+                self.dropped += 1
+            frame = newer
+
+    def _publish(self, frame):
+        while True:
+            try:
+                self.frames.put_nowait(frame)
+                return
+            except queue.Full:
+                try:
+                    self.frames.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def _run(self):
+        engine = self.engine
+        prev = engine.snapshot()
+        deadline = time.time()
+        try:
+            while not self._stop.is_set():
+                frame = self._apply_edits()
+                if frame is not None:
+                    self._publish(frame)
+                    prev = frame[1]
+                if self.delay and time.time() < deadline:
+                    # an edit or stop() ends the wait early
+                    self._wake.wait(deadline - time.time())
+                    self._wake.clear()
+                    continue
+                engine.step()
+                current = engine.snapshot()
+                info = None
+                if self.on_generation is not None:
+                    info = self.on_generation(*engine.changed_cells(prev, current))
+                self._publish((engine.generation, current, info))
+                self.produced += 1
+                prev = current
+                if self.delay:
+                    deadline = max(deadline + self.delay, time.time() - self.delay)
+        except Exception as e:
+            self.error = e
+            raise
+
+
+############################################################
+# REFERENCE ENGINE
+############################################################
+
+
+class ReferenceEngine(LifeEngine):
+    ''' ReferenceEngine class:
+        The rules exactly as the original Board.simulate ran them: one
+        neighbour list and one if/elif chain per square, every generation.
+        It is kept as the baseline the fast engines are measured against,
+        and so only runs Conway's rule on a bounded board.
+        Attributes: status - type:Dictionary - (x, y) -> 'live' or 'dead'
+                    new_status - type:Dictionary - (x, y) -> status for the
+                    next generation
+    '''
+
+    def __init__(self, width, height):
+        LifeEngine.__init__(self, width, height)
+        self.status = {}
+        self.new_status = {}
+        for y in range(height):
+            for x in range(width):
+                self.status[(x, y)] = 'dead'
+                self.new_status[(x, y)] = 'None'
+
+    def set_live(self, x, y):
+        self.status[(x, y)] = 'live'
+
+    def set_dead(self, x, y):
+        self.status[(x, y)] = 'dead'
+
+    def is_live(self, x, y):
+        return self.status[(x, y)] == 'live'
+
+    def live_cells(self):
+        return [coord for coord, status in self.status.items() if status == 'live']
+
+    def clear(self):
+        for coord in self.status:
+            self.status[coord] = 'dead'
+
+    def get_neighbors(self, coords):
+        ''' Returns the list of coordinates of the neighbours of coords.
+        '''
+        neighbors = []
+        y = -1
+        while y < 2:
+            for x in range(-1, 2):
+                if 0 <= (coords[0] + x) <= self.width - 1 and 0 <= (coords[1] + y) <= self.height - 1:
+                    neighbors.append((coords[0] + x, coords[1] + y))
+            y += 1
+        neighbors.remove(coords)
+        return neighbors
+
+    def _step(self):
+        for coords in self.status:
+            alive = 0
+            for neighbor in self.get_neighbors(coords):
+                if self.status[neighbor] == 'live':
+                    alive += 1
+            if alive < 2:
+                self.new_status[coords] = 'dead'
+            elif alive == 2 and self.status[coords] == 'live':
+                self.new_status[coords] = 'live'
+            elif alive == 3:
+                self.new_status[coords] = 'live'
+            elif alive > 3:
+                self.new_status[coords] = 'dead'
+
+        for coords, new_status in self.new_status.items():
+            if new_status == 'dead' or new_status == 'live':
+                self.status[coords] = new_status
+
+
+############################################################
+# NUMPY ENGINE
+############################################################
+
+
+def count_neighbors(padded, counts):
+    ''' Parameters: padded - type:numpy.ndarray - (h + 2, w + 2) array of
+                    the squares plus a border of one square all around
+                    counts - type:numpy.ndarray - (h, w) uint8 array
+
+        Stores in counts the number of live neighbours of every square
+        inside the border, and returns counts.
+    '''
+    h, w = counts.shape
+    np.add(padded[0:h, 0:w], padded[0:h, 1:w + 1], out=counts)
+    counts += padded[0:h, 2:w + 2]
+    counts += padded[1:h + 1, 0:w]
+    counts += padded[1:h + 1, 2:w + 2]
+    counts += padded[2:h + 2, 0:w]
+    counts += padded[2:h + 2, 1:w + 1]
+    counts += padded[2:h + 2, 2:w + 2]
+    return counts
+
+
+def pad_grid(grid, padded, boundary):
+    ''' Parameters: grid - type:numpy.ndarray - (h, w) squares
+                    padded - type:numpy.ndarray - (h + 2, w + 2) array
+                    boundary - type:string - 'bounded' or 'toroidal'
+
+        Copies grid into the middle of padded and fills its border with
+        what lies past the edges: nothing for a bounded board, and the
+        opposite edge for a toroidal one. Either way the neighbour count
+        that follows is the same plain sum.
+    '''
+    padded[1:-1, 1:-1] = grid
+    if boundary == 'toroidal':
+        padded[0, 1:-1] = grid[-1]
+        padded[-1, 1:-1] = grid[0]
+        # the columns include the corners just set above
+        padded[:, 0] = padded[:, -2]
+        padded[:, -1] = padded[:, 1]
+
+
+def next_generation(grid, counts, rule=CONWAY, out=None, scratch=None,
+                    index=None):
+    ''' Parameters: grid - type:numpy.ndarray - the squares, 0 or 1
+                    counts - type:numpy.ndarray - their live neighbours;
+                    used as scratch space, so its contents are lost
+                    rule - type:Rule
+                    out - type:numpy.ndarray - uint8 array the shape of
+                    grid for the result, not grid itself (default: a new
+                    array)
+                    scratch - type:numpy.ndarray - bool array the shape of
+                    grid used by short rules (default: a new array)
+                    index - type:numpy.ndarray - intp array the shape of
+                    grid used by long rules (default: a new array)
+
+        Returns out, holding the next generation of grid.
+    '''
+    if out is None:
+        out = np.empty(grid.shape, dtype=np.uint8)
+    if len(rule.birth) + len(rule.survival) > 4:
+        # Long rules: look up every square in the rule's state table.
+        # A gather costs a few whole-array passes, so short rules are
+        # quicker with one comparison per neighbour count.
+        counts <<= 1
+        counts |= grid
+        # take wants intp indexes, and buffers out unless told the
+        # indexes need no checking
+        if index is None:
+            index = np.empty(grid.shape, dtype=np.intp)
+        index[...] = counts
+        return rule.state_array.take(index, out=out, mode='clip')
+    if scratch is None:
+        scratch = np.empty(grid.shape, dtype=bool)
+    new = out.view(bool)
+    new[...] = False
+    # counts in both birth and survival make a square live either way
+    both = rule.birth & rule.survival
+    for n in both:
+        np.equal(counts, n, out=scratch)
+        new |= scratch
+    for n in rule.survival - both:
+        np.equal(counts, n, out=scratch)
+        np.logical_and(scratch, grid, out=scratch)
+        new |= scratch
+    for n in rule.birth - both:
+        np.equal(counts, n, out=scratch)
+        # True > 0: the count matches and the square is dead
+        np.greater(scratch, grid, out=scratch)
+        new |= scratch
+    return out
+
+
+class NumpyEngine(LifeEngine):
+    ''' NumpyEngine class:
+        Keeps the board in a 2D NumPy array and computes each generation
+        with vectorized neighbour sums instead of one Python call per square.
+        The board is either bounded or toroidal.
+        Attributes: grid - type:numpy.ndarray - (height, width) array of
+                    0 (dead) and 1 (live), indexed as grid[y, x]
+    '''
+
+    BOUNDARIES = ('bounded', 'toroidal')
+
+    def __init__(self, width, height, boundary='bounded', rule=CONWAY):
+        LifeEngine.__init__(self, width, height, boundary, rule)
+        self.grid = np.zeros((height, width), dtype=np.uint8)
+        # Scratch buffers are reused every generation so that stepping
+        # does not allocate: the next generation is written into _next,
+        # which then swaps with grid. The padded copy has a border of
+        # dead squares.
+        self._next = np.zeros((height, width), dtype=np.uint8)
+        self._padded = np.zeros((height + 2, width + 2), dtype=np.uint8)
+        self._counts = np.zeros((height, width), dtype=np.uint8)
+        self._scratch = np.zeros((height, width), dtype=bool)
+        self._index = None
+
+    def set_live(self, x, y):
+        self.grid[y, x] = 1
+
+    def set_dead(self, x, y):
+        self.grid[y, x] = 0
+
+    def is_live(self, x, y):
+        return self.grid[y, x] == 1
+
+    def live_cells(self):
+        ys, xs = np.nonzero(self.grid)
+        return list(zip(xs.tolist(), ys.tolist()))
+
+    def population(self):
+        return int(np.count_nonzero(self.grid))
+
+    def snapshot(self):
+        return self.grid.copy()
+
+    def changed_cells(self, prev, next):
+        ys, xs = np.nonzero(next > prev)
+        born = list(zip(xs.tolist(), ys.tolist()))
+        ys, xs = np.nonzero(next < prev)
+        died = list(zip(xs.tolist(), ys.tolist()))
+        return born, died
+
+    def seed_runs(self, ys, xs, lengths):
+        ys, xs = expand_runs(ys, xs, lengths)
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        self.grid[ys[inside], xs[inside]] = 1
+
+    def packed_snapshot(self, snapshot):
+        return 0, 0, self.width, self.height, np.packbits(snapshot, axis=1)
+
+    def region(self, snapshot, x0, y0, width, height, shrink=1):
+        area = np.zeros((height, width), dtype=np.uint8)
+        # the part of the board the area covers
+        gx0 = max(x0, 0)
+        gx1 = min(x0 + width * shrink, self.width)
+        gy0 = max(y0, 0)
+        gy1 = min(y0 + height * shrink, self.height)
+        if gx0 >= gx1 or gy0 >= gy1:
+            return area
+        part = snapshot[gy0:gy1, gx0:gx1]
+        i0 = (gy0 - y0) // shrink
+        j0 = (gx0 - x0) // shrink
+        if shrink > 1:
+            # or together the squares of every block, rows then columns,
+            # without copying the area at full size
+            rows = np.maximum(y0 + np.arange(i0, (gy1 - y0 - 1) // shrink + 1) * shrink, gy0)
+            cols = np.maximum(x0 + np.arange(j0, (gx1 - x0 - 1) // shrink + 1) * shrink, gx0)
+            part = np.maximum.reduceat(part, rows - gy0, axis=0)
+            part = np.maximum.reduceat(part, cols - gx0, axis=1)
+        area[i0:i0 + part.shape[0], j0:j0 + part.shape[1]] = part
+        return area
+
+    def load_packed(self, rows, width, x0=0, y0=0):
+        # the part of the rows that lands on the board
+        gx0 = max(x0, 0)
+        gx1 = min(x0 + width, self.width)
+        gy0 = max(y0, 0)
+        gy1 = min(y0 + len(rows), self.height)
+        for y in range(gy0, gy1, PACKED_SLAB):
+            slab = rows[y - y0:min(y + PACKED_SLAB, gy1) - y0]
+            bits = np.unpackbits(slab, axis=1)[:, gx0 - x0:gx1 - x0]
+            self.grid[y:y + len(bits), gx0:gx1] |= bits
+
+    def random_seed(self, percentage):
+        live = np.random.random_sample(self.grid.shape) < percentage
+        self.grid |= live.view(np.uint8)
+
+    def clear(self):
+        self.grid[...] = 0
+
+    def neighbor_counts(self):
+        ''' Returns a (height, width) array holding the number of live
+            neighbours of every square.
+        '''
+        pad_grid(self.grid, self._padded, self.boundary)
+        return count_neighbors(self._padded, self._counts)
+
+    def _step(self):
+        rule = self.rule
+        if self._index is None and len(rule.birth) + len(rule.survival) > 4:
+            self._index = np.empty(self.grid.shape, dtype=np.intp)
+        grid = next_generation(self.grid, self.neighbor_counts(), rule,
+                               self._next, self._scratch, self._index)
+        self._next = self.grid
+        self.grid = grid
+
+
+############################################################
+# PARALLEL ENGINE
+############################################################
+
+# The two shared grids of a ParallelEngine, as seen by a worker process.
+# They are set once by _init_worker when the pool starts.
+_worker_grids = None
+
+
+_worker_boundary = None
+_worker_rule = None
+
+
+def _init_worker(buffers, width, height, boundary, rule):
+    global _worker_grids, _worker_boundary, _worker_rule
+    _worker_grids = [np.frombuffer(buf, dtype=np.uint8).reshape(height, width)
+                     for buf in buffers]
+    _worker_boundary = boundary
+    _worker_rule = Rule(rule)
+
+
+def _step_tile(args):
+    ''' Parameters: args - type:tuple - (src, y0, y1)
+
+        Computes rows y0 to y1 of the next generation from shared grid src
+        into the other shared grid. The rows just above and below the tile
+        (the halo) are read straight from the shared grid.
+    '''
+    src, y0, y1 = args
+    grid = _worker_grids[src]
+    height, width = grid.shape
+    padded = np.zeros((y1 - y0 + 2, width + 2), dtype=np.uint8)
+    padded[1:-1, 1:-1] = grid[y0:y1]
+    if _worker_boundary == 'toroidal':
+        padded[0, 1:-1] = grid[(y0 - 1) % height]
+        padded[-1, 1:-1] = grid[y1 % height]
+        padded[:, 0] = padded[:, -2]
+        padded[:, -1] = padded[:, 1]
+    else:
+        # halo rows that are off the board stay as dead squares
+        if y0 > 0:
+            padded[0, 1:-1] = grid[y0 - 1]
+        if y1 < height:
+            padded[-1, 1:-1] = grid[y1]
+    counts = count_neighbors(padded, np.empty((y1 - y0, width), dtype=np.uint8))
+    next_generation(grid[y0:y1], counts, _worker_rule,
+                    out=_worker_grids[1 - src][y0:y1])
+
+
+class ParallelEngine(NumpyEngine):
+    ''' ParallelEngine class:
+        Splits the board into horizontal tiles and steps them in parallel
+        with a multiprocessing pool. The board lives in two grids of shared
+        memory that all processes see, one for the current generation and
+        one for the next, so nothing but the tile bounds is pickled per
+        generation. The rules are the same functions NumpyEngine uses.
+        Call close() when done to stop the worker processes.
+        Attributes: processes - type:int - number of worker processes
+                    tiles - type:list - (y0, y1) rows of every tile
+    '''
+
+    def __init__(self, width, height, processes=None, tiles=None,
+                 boundary='bounded', rule=CONWAY):
+        NumpyEngine.__init__(self, width, height, boundary, rule)
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        if tiles is None:
+            tiles = processes
+        tiles = max(1, min(tiles, height))
+        self.processes = processes
+        self.tiles = [(height * i // tiles, height * (i + 1) // tiles)
+                      for i in range(tiles)]
+        self._buffers = [multiprocessing.RawArray('B', width * height)
+                         for i in range(2)]
+        self._grids = [np.frombuffer(buf, dtype=np.uint8).reshape(height, width)
+                       for buf in self._buffers]
+        self._src = 0
+        self.grid = self._grids[0]
+        self._pool = multiprocessing.Pool(processes, _init_worker,
+                                          (self._buffers, width, height,
+                                           boundary, str(self.rule)))
+
+    def _step(self):
+        src = self._src
+        self._pool.map(_step_tile, [(src, y0, y1) for y0, y1 in self.tiles])
+        self._src = 1 - src
+        self.grid = self._grids[self._src]
+
+    def close(self):
+        ''' Stops the worker processes.
+        '''
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+
+############################################################
+# SPARSE ENGINE
+############################################################
+
+
+class SparseEngine(LifeEngine):
+    ''' SparseEngine class:
+        Stores only the coordinates of the live squares in a set, and each
+        generation only looks at the live squares and their neighbours.
+        The cost of a generation follows the population, not the board area.
+        The board can be bounded, toroidal or infinite; without a width and
+        height it is infinite. An infinite board may still have a width and
+        height, which then only give the area random_seed fills.
+        Attributes: live - type:set - the (x, y) tuples of the live squares
+    '''
+
+    BOUNDARIES = ('bounded', 'toroidal', 'infinite')
+
+    def __init__(self, width=None, height=None, boundary=None, rule=CONWAY):
+        if boundary is None:
+            if width is None or height is None:
+                boundary = 'infinite'
+            else:
+                boundary = 'bounded'
+        if boundary != 'infinite' and (width is None or height is None):
+            raise ValueError("a %s board needs a width and height" % boundary)
+        LifeEngine.__init__(self, width, height, boundary, rule)
+        self._check_no_b0()
+        self.live = set()
+
+    def in_bounds(self, x, y):
+        if self.boundary == 'infinite':
+            return True
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def random_seed(self, percentage):
+        if self.width is None or self.height is None:
+            raise ValueError("random_seed needs a board with a width and height")
+        LifeEngine.random_seed(self, percentage)
+
+    def set_live(self, x, y):
+        self.live.add((x, y))
+
+    def set_dead(self, x, y):
+        self.live.discard((x, y))
+
+    def is_live(self, x, y):
+        return (x, y) in self.live
+
+    def live_cells(self):
+        return list(self.live)
+
+    def population(self):
+        return len(self.live)
+
+    def clear(self):
+        self.live = set()
+
+    def _step(self):
+        live = self.live
+        counts = defaultdict(int)
+        if self.boundary == 'toroidal':
+            width = self.width
+            height = self.height
+            for x, y in live:
+                for dx, dy in NEIGHBOR_OFFSETS:
+                    counts[((x + dx) % width, (y + dy) % height)] += 1
+        else:
+            for x, y in live:
+                for dx, dy in NEIGHBOR_OFFSETS:
+                    counts[(x + dx, y + dy)] += 1
+        # without B0 only squares with at least one live neighbour can be
+        # live next generation, and those are exactly the keys of counts.
+        # Live squares that are not keys have 0 neighbours.
+        state_table = self.rule.state_table
+        new = set()
+        for coord, alive in counts.items():
+            if state_table[(alive << 1) | (coord in live)]:
+                new.add(coord)
+        if 0 in self.rule.survival:
+            new.update(coord for coord in live if coord not in counts)
+        if self.boundary == 'bounded':
+            in_bounds = self.in_bounds
+            new = set(coord for coord in new if in_bounds(coord[0], coord[1]))
+        self.live = new
+
+
+############################################################
+# BIT-PACKED ENGINE
+############################################################
+
+
+def int_to_bits(value, width):
+    ''' Returns a 1D uint8 NumPy array of width 0 and 1 whose element x
+        is bit x of value, the inverse of bits_to_int.
+    '''
+    nbytes = (width + 7) // 8
+    data = unhexlify('%0*x' % (2 * nbytes, value))[::-1]
+    return np.unpackbits(REVERSED_BITS[np.frombuffer(data, dtype=np.uint8)])[:width]
+
+
+# byte -> the same byte with its bits in reverse order
+REVERSED_BITS = np.packbits(
+    np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1)[:, ::-1], axis=1)[:, 0]
+
+
+def bits_to_int(bits):
+    ''' Parameters: bits - a 1D NumPy array of 0 and 1 (or booleans)
+
+        Returns a Python int whose bit x is bits[x].
+    '''
+    if len(bits) == 0:
+        return 0
+    # packbits puts the first element in the highest bit, so pack the
+    # reversed row and drop the zero padding packbits adds at the end
+    packed = np.packbits(np.asarray(bits, dtype=bool)[::-1])
+    return int(hexlify(packed.tobytes()), 16) >> (-len(bits) % 8)
+
+
+class BitEngine(LifeEngine):
+    ''' BitEngine class:
+        Keeps every row of the board as one Python int, one bit per square,
+        so a 10000x10000 board takes about 12 MB. Each generation counts
+        the neighbours of a whole row at once with bitwise adders.
+        The board is either bounded or toroidal.
+        Attributes: rows - type:list - one int per row; bit x of rows[y]
+                    is set if the square (x, y) is live
+    '''
+
+    BOUNDARIES = ('bounded', 'toroidal')
+
+    def __init__(self, width, height, boundary='bounded', rule=CONWAY):
+        LifeEngine.__init__(self, width, height, boundary, rule)
+        self.mask = (1 << width) - 1
+        self.rows = [0] * height
+
+    def set_live(self, x, y):
+        self.rows[y] |= 1 << x
+
+    def set_dead(self, x, y):
+        self.rows[y] &= ~(1 << x)
+
+    def is_live(self, x, y):
+        return (self.rows[y] >> x) & 1 == 1
+
+    def live_cells(self):
+        cells = []
+        for y, row in enumerate(self.rows):
+            while row:
+                low = row & -row
+                cells.append((low.bit_length() - 1, y))
+                row ^= low
+        return cells
+
+    def population(self):
+        return sum(bin(row).count('1') for row in self.rows)
+
+    def snapshot(self):
+        # ints are immutable, so a shallow copy of the list is enough
+        return tuple(self.rows)
+
+    def changed_cells(self, prev, next):
+        born = []
+        died = []
+        for y in range(len(next)):
+            flipped = prev[y] ^ next[y]
+            while flipped:
+                low = flipped & -flipped
+                x = low.bit_length() - 1
+                if next[y] & low:
+                    born.append((x, y))
+                else:
+                    died.append((x, y))
+                flipped ^= low
+        return born, died
+
+    def seed_runs(self, ys, xs, lengths):
+        ys, xs = expand_runs(ys, xs, lengths)
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        ys = ys[inside]
+        xs = xs[inside]
+        order = np.argsort(ys, kind='mergesort')
+        ys = ys[order]
+        xs = xs[order]
+        # unpack a slab of rows at a time into a boolean array, then pack
+        # every row of the slab into an int
+        slab = 256
+        starts = np.searchsorted(ys, np.arange(0, self.height + slab, slab))
+        for i in range(len(starts) - 1):
+            if starts[i] == starts[i + 1]:
+                continue
+            y0 = i * slab
+            block = np.zeros((min(slab, self.height - y0), self.width), dtype=bool)
+            block[ys[starts[i]:starts[i + 1]] - y0, xs[starts[i]:starts[i + 1]]] = True
+            for y in np.nonzero(block.any(axis=1))[0].tolist():
+                self.rows[y0 + y] |= bits_to_int(block[y])
+
+    def packed_snapshot(self, snapshot):
+        nbytes = (self.width + 7) // 8
+        # a row's int written little-endian has square x in bit x % 8 of
+        # byte x // 8; packbits order wants it in bit 7 - x % 8
+        data = b''.join(unhexlify('%0*x' % (2 * nbytes, row))[::-1]
+                        for row in snapshot)
+        rows = REVERSED_BITS[np.frombuffer(data, dtype=np.uint8)]
+        return 0, 0, self.width, self.height, rows.reshape(self.height, nbytes)
+
+    def region(self, snapshot, x0, y0, width, height, shrink=1):
+        area = np.zeros((height, width), dtype=np.uint8)
+        span = width * shrink
+        for i in range(height):
+            # or together the rows of the block row, then the columns
+            row = 0
+            for y in range(max(y0 + i * shrink, 0), min(y0 + (i + 1) * shrink, self.height)):
+                row |= snapshot[y]
+            if row:
+                row = row >> x0 if x0 >= 0 else row << -x0
+                bits = int_to_bits(row & ((1 << span) - 1), span)
+                area[i] = bits.reshape(width, shrink).max(axis=1)
+        return area
+
+    def load_packed(self, rows, width, x0=0, y0=0):
+        for y in range(max(y0, 0), min(y0 + len(rows), self.height)):
+            packed = REVERSED_BITS[rows[y - y0]][::-1]
+            row = int(hexlify(packed.tobytes()) or b'0', 16) & ((1 << width) - 1)
+            if x0 >= 0:
+                row <<= x0
+            else:
+                row >>= -x0
+            self.rows[y] |= row & self.mask
+
+    def random_seed(self, percentage):
+        for y in range(self.height):
+            live = np.random.random_sample(self.width) < percentage
+            self.rows[y] |= bits_to_int(live)
+
+    def clear(self):
+        self.rows = [0] * self.height
+
+    def _shifted(self, row):
+        ''' Returns (left, right): row with every square moved onto its right
+            neighbour's bit and onto its left neighbour's bit, so that bit x
+            of left is square x - 1 and bit x of right is square x + 1.
+        '''
+        left = (row << 1) & self.mask
+        right = row >> 1
+        if self.boundary == 'toroidal':
+            # the squares that fell off one edge come back on the other
+            left |= row >> (self.width - 1)
+            right |= (row & 1) << (self.width - 1)
+        return left, right
+
+    def _step(self):
+        rows = self.rows
+        shifted = [self._shifted(row) for row in rows]
+        # For every row, the sum of each square and its left and right
+        # neighbours as a 2 bit number: (ones, twos), one bit per square.
+        ones = []
+        twos = []
+        for row, (left, right) in zip(rows, shifted):
+            ones.append(left ^ row ^ right)
+            twos.append((left & row) | (right & (left ^ row)))
+        # add the rows past the top and bottom edges, so that row y of the
+        # board has row y above it and row y + 2 below it
+        if self.boundary == 'toroidal':
+            ones = [ones[-1]] + ones + [ones[0]]
+            twos = [twos[-1]] + twos + [twos[0]]
+        else:
+            ones = [0] + ones + [0]
+            twos = [0] + twos + [0]
+
+        conway = self.rule == CONWAY
+        new_rows = []
+        for y, row in enumerate(rows):
+            # the middle row only counts the left and right neighbours
+            left, right = shifted[y]
+            up0 = ones[y]
+            up1 = twos[y]
+            down0 = ones[y + 2]
+            down1 = twos[y + 2]
+            mid0 = left ^ right
+            mid1 = left & right
+            # add the three 2 bit numbers: s0 is the ones bit of the sum,
+            # carry goes to the twos
+            s0 = up0 ^ down0 ^ mid0
+            carry = (up0 & down0) | (mid0 & (up0 ^ down0))
+            if conway:
+                # s1 is the twos bit, and at_least4 is set where two or more
+                # of the four twos inputs are set, i.e. the count is 4 or more
+                a = up1 ^ down1
+                b = mid1 ^ carry
+                s1 = a ^ b
+                at_least4 = (up1 & down1) | (mid1 & carry) | (a & b)
+                # live with 3 neighbours, or with 2 if the square is live now
+                new_rows.append(s1 & ~at_least4 & (s0 | row))
+            else:
+                new_rows.append(self._apply_rule(row, s0, up1, down1, mid1, carry))
+        self.rows = new_rows
+
+    def _apply_rule(self, row, s0, up1, down1, mid1, carry):
+        ''' Returns the next generation of a row for any rule, given the
+            ones bit s0 of the neighbour counts and the four bits of
+            weight 2 still to be added up.
+        '''
+        mask = self.mask
+        # add the four twos: u is the sum of the first three, 0 to 3
+        u0 = up1 ^ down1 ^ mid1
+        u1 = (up1 & down1) | (mid1 & (up1 ^ down1))
+        s1 = u0 ^ carry
+        c = u0 & carry
+        s2 = u1 ^ c
+        s3 = u1 & c
+        # the bits of the neighbour count, and their complements
+        bits = [(s0, ~s0 & mask), (s1, ~s1 & mask),
+                (s2, ~s2 & mask), (s3, ~s3 & mask)]
+        dead = ~row & mask
+        new = 0
+        for counts, state in ((self.rule.birth, dead), (self.rule.survival, row)):
+            for n in counts:
+                match = state
+                for i in range(4):
+                    match &= bits[i][0] if (n >> i) & 1 else bits[i][1]
+                new |= match
+        return new
+
+
+############################################################
+# HASHLIFE ENGINE
+############################################################
+
+
+class _Node(object):
+    ''' _Node class:
+        A square quadtree node of side 2**level, made of four nodes of
+        side 2**(level - 1). Nodes are canonical: two nodes with the same
+        contents are the same object, so they are compared by identity.
+        Level 0 nodes are single squares.
+    '''
+
+    __slots__ = ('level', 'nw', 'ne', 'sw', 'se', 'population')
+
+    def __init__(self, level, nw, ne, sw, se, population):
+        self.level = level
+        self.nw = nw
+        self.ne = ne
+        self.sw = sw
+        self.se = se
+        self.population = population
+
+
+_DEAD = _Node(0, None, None, None, None, 0)
+_LIVE = _Node(0, None, None, None, None, 1)
+
+
+class HashLifeEngine(LifeEngine):
+    ''' HashLifeEngine class:
+        Gosper's HashLife. The board is a quadtree of canonical nodes, and
+        the future of every node is memoized, so repetitive patterns can
+        be advanced 2**k generations in a single call. The board always
+        is an unbounded plane, so a pattern that reaches the edge of a
+        displayed Board keeps evolving off the screen.
+        Attributes: max_nodes - type:int - number of cached nodes at which
+                    the cache is evicted. Each node with its memoized
+                    result costs roughly NODE_BYTES bytes of memory
+                    root - type:_Node - the quadtree holding the board
+                    origin - type:tuple - (x, y) of the top left of root
+    '''
+
+    NODE_BYTES = 400
+
+    BOUNDARIES = ('infinite',)
+
+    def __init__(self, max_nodes=1000000, rule=CONWAY):
+        LifeEngine.__init__(self, None, None, 'infinite', rule)
+        self._check_no_b0()
+        self.max_nodes = max_nodes
+        # canonical node table: (nw, ne, sw, se) -> node
+        self._nodes = {}
+        # memoized futures: (node, j) -> center of node, 2**j generations on
+        self._results = {}
+        self._empties = [_DEAD]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # number of nodes at which the next eviction happens; it only goes
+        # above max_nodes when the board itself needs more nodes than that
+        self._node_limit = max_nodes
+        self.root = self._empty(3)
+        self.origin = (-4, -4)
+
+    def in_bounds(self, x, y):
+        return True
+
+    def cache_stats(self):
+        ''' Returns a dictionary with the node cache statistics.
+        '''
+        return {'nodes': len(self._nodes),
+                'results': len(self._results),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'max_nodes': self.max_nodes}
+
+    ### Node construction
+
+    def _join(self, nw, ne, sw, se):
+        ''' Returns the canonical node made of the four given nodes.
+        '''
+        key = (nw, ne, sw, se)
+        node = self._nodes.get(key)
+        if node is None:
+            if len(self._nodes) >= self._node_limit:
+                self._evict()
+            node = _Node(nw.level + 1, nw, ne, sw, se,
+                         nw.population + ne.population +
+                         sw.population + se.population)
+            self._nodes[key] = node
+        return node
+
+    def _empty(self, level):
+        ''' Returns the empty node of the given level.
+        '''
+        while len(self._empties) <= level:
+            e = self._empties[-1]
+            self._empties.append(self._join(e, e, e, e))
+        return self._empties[level]
+
+    def _centre(self, node):
+        ''' Returns a node one level up with node in its middle.
+        '''
+        e = self._empty(node.level - 1)
+        return self._join(self._join(e, e, e, node.nw),
+                          self._join(e, e, node.ne, e),
+                          self._join(e, node.sw, e, e),
+                          self._join(node.se, e, e, e))
+
+    def _is_padded(self, node):
+        ''' Returns True if all the live squares of node are inside its
+            middle quarter, so that its future cannot leave its center.
+        '''
+        return (node.nw.population == node.nw.se.se.population and
+                node.ne.population == node.ne.sw.sw.population and
+                node.sw.population == node.sw.ne.ne.population and
+                node.se.population == node.se.nw.nw.population)
+
+    def _evict(self):
+        ''' Drops the memoized results and every node that is not part of
+            the current board, bringing memory back under the limit.
+            Nodes already in use keep working; they just lose sharing.
+        '''
+        self.evictions += 1
+        self._results = {}
+        self._nodes = {}
+        empties = self._empties
+        self._empties = [_DEAD]
+        keep = {}
+        stack = [self.root] + empties[1:]
+        while stack:
+            node = stack.pop()
+            if node.level == 0:
+                continue
+            key = (node.nw, node.ne, node.sw, node.se)
+            if key not in keep:
+                keep[key] = node
+                stack.extend(key)
+        self._nodes = keep
+        self._empties = empties
+        self._node_limit = max(self.max_nodes, 2 * len(keep))
+
+    ### Evolution
+
+    def _life_4x4(self, node):
+        ''' Base case: returns the 2x2 center of a 4x4 node,
+            one generation on.
+        '''
+        nw, ne, sw, se = node.nw, node.ne, node.sw, node.se
+        # the 16 squares as one int, bit y * 4 + x for square (x, y)
+        bits = 0
+        for i, leaf in enumerate((nw.nw, nw.ne, ne.nw, ne.ne,
+                                  nw.sw, nw.se, ne.sw, ne.se,
+                                  sw.nw, sw.ne, se.nw, se.ne,
+                                  sw.sw, sw.se, se.sw, se.se)):
+            bits |= leaf.population << i
+        table = self.rule.table
+        center = []
+        for y in (1, 2):
+            for x in (1, 2):
+                # the 3x3 neighbourhood of (x, y) as a rule table index
+                rows = bits >> ((y - 1) * 4 + x - 1)
+                index = (rows & 7) | ((rows >> 4) & 7) << 3 | ((rows >> 8) & 7) << 6
+                center.append(_LIVE if table[index] else _DEAD)
+        return self._join(center[0], center[1], center[2], center[3])
+
+    def _successor(self, node, j):
+        ''' Returns the center of node (one level down) 2**j generations
+            in the future. j must be at most node.level - 2.
+        '''
+        if node.population == 0:
+            return node.nw
+        key = (node, j)
+        result = self._results.get(key)
+        if result is not None:
+            self.hits += 1
+            return result
+        self.misses += 1
+
+        if node.level == 2:
+            result = self._life_4x4(node)
+        else:
+            join = self._join
+            successor = self._successor
+            nw, ne, sw, se = node.nw, node.ne, node.sw, node.se
+            # at full speed the future is computed in two halves of
+            # 2**(j - 1) generations each
+            full_speed = j == node.level - 2
+            i = j - 1 if full_speed else j
+            # the nine overlapping sub-squares of one level down
+            c1 = successor(nw, i)
+            c2 = successor(join(nw.ne, ne.nw, nw.se, ne.sw), i)
+            c3 = successor(ne, i)
+            c4 = successor(join(nw.sw, nw.se, sw.nw, sw.ne), i)
+            c5 = successor(join(nw.se, ne.sw, sw.ne, se.nw), i)
+            c6 = successor(join(ne.sw, ne.se, se.nw, se.ne), i)
+            c7 = successor(sw, i)
+            c8 = successor(join(sw.ne, se.nw, sw.se, se.sw), i)
+            c9 = successor(se, i)
+            if not full_speed:
+                # the sub-squares already went far enough: take their centers
+                result = join(join(c1.se, c2.sw, c4.ne, c5.nw),
+                              join(c2.se, c3.sw, c5.ne, c6.nw),
+                              join(c4.se, c5.sw, c7.ne, c8.nw),
+                              join(c5.se, c6.sw, c8.ne, c9.nw))
+            else:
+                result = join(successor(join(c1, c2, c4, c5), i),
+                              successor(join(c2, c3, c5, c6), i),
+                              successor(join(c4, c5, c7, c8), i),
+                              successor(join(c5, c6, c8, c9), i))
+        self._results[key] = result
+        return result
+
+    def step_pow2(self, k):
+        ''' Parameters: k - type:int
+
+            Advances the board by 2**k generations in one call.
+        '''
+        # a padded root leaves a margin of size/8 between its live squares
+        # and the center the result covers; a pattern growing at one square
+        # per generation needs 2**k of it, so root must be 2**(k + 3) wide
+        while self.root.level < k + 3 or not self._is_padded(self.root):
+            self._grow()
+        # the successor of root is its center, a quarter of root's side in
+        size = 1 << self.root.level
+        self.root = self._successor(self.root, k)
+        self.origin = (self.origin[0] + size // 4, self.origin[1] + size // 4)
+        self.generation += 1 << k
+
+    def step(self, generations=1):
+        k = 0
+        while generations:
+            if generations & 1:
+                self.step_pow2(k)
+            generations >>= 1
+            k += 1
+
+    def _grow(self):
+        ''' Doubles the side of root, keeping the board in its middle.
+        '''
+        size = 1 << self.root.level
+        self.root = self._centre(self.root)
+        self.origin = (self.origin[0] - size // 2, self.origin[1] - size // 2)
+
+    ### Board access
+
+    def _build(self, level, x0, y0, cells):
+        ''' Returns the node of the given level with top left (x0, y0)
+            holding the live squares in cells.
+        '''
+        if not cells:
+            return self._empty(level)
+        if level == 0:
+            return _LIVE
+        half = 1 << (level - 1)
+        xm = x0 + half
+        ym = y0 + half
+        nw = []
+        ne = []
+        sw = []
+        se = []
+        for cell in cells:
+            if cell[1] < ym:
+                if cell[0] < xm:
+                    nw.append(cell)
+                else:
+                    ne.append(cell)
+            elif cell[0] < xm:
+                sw.append(cell)
+            else:
+                se.append(cell)
+        return self._join(self._build(level - 1, x0, y0, nw),
+                          self._build(level - 1, xm, y0, ne),
+                          self._build(level - 1, x0, ym, sw),
+                          self._build(level - 1, xm, ym, se))
+
+    def _set_cells(self, cells):
+        ''' Rebuilds the board so that exactly the given squares are live.
+        '''
+        if not cells:
+            self.root = self._empty(3)
+            self.origin = (-4, -4)
+            return
+        xs = [x for x, y in cells]
+        ys = [y for x, y in cells]
+        x0 = min(xs)
+        y0 = min(ys)
+        level = 3
+        while (1 << level) <= max(max(xs) - x0, max(ys) - y0):
+            level += 1
+        self.root = self._build(level, x0, y0, list(cells))
+        self.origin = (x0, y0)
+
+    def seed(self, block_coords):
+        cells = set(self.live_cells())
+        cells.update(block_coords)
+        self._set_cells(cells)
+
+    def set_live(self, x, y):
+        self.seed([(x, y)])
+
+    def set_dead(self, x, y):
+        cells = set(self.live_cells())
+        cells.discard((x, y))
+        self._set_cells(cells)
+
+    def random_seed(self, percentage):
+        raise ValueError("HashLifeEngine has no width and height to fill")
+
+    def clear(self):
+        self._set_cells(())
+
+    def population(self):
+        return self.root.population
+
+    def is_live(self, x, y):
+        node = self.root
+        x -= self.origin[0]
+        y -= self.origin[1]
+        size = 1 << node.level
+        if not (0 <= x < size and 0 <= y < size):
+            return False
+        while node.level > 0 and node.population:
+            size >>= 1
+            if y < size:
+                node = node.nw if x < size else node.ne
+            else:
+                node = node.sw if x < size else node.se
+            x %= size
+            y %= size
+        return node.population == 1
+
+    def live_cells(self):
+        cells = []
+        stack = [(self.root, self.origin[0], self.origin[1])]
+        while stack:
+            node, x, y = stack.pop()
+            if node.population == 0:
+                continue
+            if node.level == 0:
+                cells.append((x, y))
+                continue
+            half = 1 << (node.level - 1)
+            stack.append((node.nw, x, y))
+            stack.append((node.ne, x + half, y))
+            stack.append((node.sw, x, y + half))
+            stack.append((node.se, x + half, y + half))
+        return cells
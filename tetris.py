@@ -1,5 +1,5 @@
 from graphics import *
-import random
+from tetris_core import TetrisCore, SHAPES, ROTATIONS, rotate_coords
 
 ############################################################
 # BLOCK CLASS
@@ -72,8 +72,14 @@ class Shape():
                     rotation_dir - type: int - the current rotation direction
                     of the shape shift_rotation_dir - type: Boolean - whether
                     or not the shape rotates
+                    rotations - type: tuple - the rotation states of the
+                    shape, see tetris_core.ROTATIONS (None: compute the
+                    rotations instead)
+                    rotation_state - type: int - index in rotations
     '''
 
+    rotations = None
+
     def __init__(self, coords, color):
         self.blocks = []
         self.rotation_dir = 1
@@ -81,6 +87,7 @@ class Shape():
         ### Defaults to false since only 3 shapes shift rotation directions
         ###(I, S and Z)
         self.shift_rotation_dir = False
+        self.rotation_state = 0
 
         for pos in coords:
             self.blocks.append(Block(pos, color))
@@ -139,6 +146,15 @@ class Shape():
 
         return True
 
+    def place(self, coords):
+        ''' Parameters: coords - list of (x, y) squares, one per block
+
+            moves each block to its square
+        '''
+        for block, (x, y) in zip(self.blocks, coords):
+            if (x, y) != (block.x, block.y):
+                block.move(x - block.x, y - block.y)
+
     def get_rotation_dir(self):
         ''' Return value: type: int
 
@@ -146,27 +162,49 @@ class Shape():
         '''
         return self.rotation_dir
 
+    def rotated_coords(self):
+        ''' Return value: type: list
+
+            returns the squares of the blocks after a rotation, looked up
+            in the rotation table if the shape has one
+        '''
+        if self.rotations is None:
+            coords = [(block.x, block.y) for block in self.blocks]
+            return rotate_coords(coords, self.get_rotation_dir())
+        offsets, masks, rotation_dir, shift = self.rotations[self.rotation_state]
+        if shift is None:
+            return [(block.x, block.y) for block in self.blocks]
+        # the top left of the shape, from its first block
+        x = self.blocks[0].x - offsets[0][0] + shift[0]
+        y = self.blocks[0].y - offsets[0][1] + shift[1]
+        state = self.rotations[(self.rotation_state + 1) % len(self.rotations)]
+        return [(x + dx, y + dy) for dx, dy in state[0]]
+
+    def set_rotation_state(self, state):
+        ''' Parameters: state - type: int - index in rotations
+
+            records that the blocks were placed in that rotation state
+        '''
+        self.rotation_state = state
+        if self.rotations is not None:
+            self.rotation_dir = self.rotations[state][2]
+
     def can_rotate(self, board):
         ''' Parameters: board - type: Board object
             Return value: type : bool
 
             Checks if the shape can be rotated.
 
-            1. Get the rotation direction using the get_rotation_dir method
-            2. Compute the position of each block after rotation and check if
-            the new position is valid
-            3. If any of the blocks cannot be moved to their new position,
+            1. Look up the position of each block after rotation and check
+            if the new position is valid
+            2. If any of the blocks cannot be moved to their new position,
             return False
 
             otherwise all is good, return True
         '''
 
-        rot = self.get_rotation_dir()
-        center = self.blocks[1]
-        for block in self.blocks:
-            x = center.x - rot * center.y + rot * block.y
-            y = center.y + rot * center.x - rot * block.x
-            if not Block.can_move(block, board, x - block.x, y - block.y):
+        for x, y in self.rotated_coords():
+            if not board.can_move(x, y):
                 return False
         return True
 
@@ -174,22 +212,18 @@ class Shape():
         ''' Parameters: board - type: Board object
 
             rotates the shape:
-            1. Get the rotation direction using the get_rotation_dir method
-            2. Compute the position of each block after rotation
-            3. Move the block to the new position
+            1. Look up the position of each block after rotation
+            2. Move the block to the new position
 
         '''
 
-        rot = self.get_rotation_dir()
-        center = self.blocks[1]
-        for block in self.blocks:
-            x = center.x - rot * center.y + rot * block.y
-            y = center.y + rot * center.x - rot * block.x
-            block.move(x - block.x, y - block.y)
-
+        self.place(self.rotated_coords())
+        if self.rotations is not None:
+            self.set_rotation_state((self.rotation_state + 1)
+                                    % len(self.rotations))
         ### This ensures that pieces which switch rotations definitely
         ### remain within their accepted rotation positions.
-        if self.shift_rotation_dir:
+        elif self.shift_rotation_dir:
             self.rotation_dir *= -1
 
 ############################################################
@@ -197,44 +231,45 @@ class Shape():
 ############################################################
 
 
+def shape_points(kind, center):
+    ''' Parameters: kind - type:int - index of the shape in tetris_core.SHAPES
+                    center - type:Point - the spawn point of the shape
+
+        Returns the list of Points of the squares of the shape
+    '''
+    return [Point(center.x + dx, center.y + dy) for dx, dy in SHAPES[kind][1]]
+
+
 class I_shape(Shape):
+    rotations = ROTATIONS[0]
+
     def __init__(self, center):
-        coords = [Point(center.x - 2, center.y),
-                  Point(center.x - 1, center.y),
-                  Point(center.x, center.y),
-                  Point(center.x + 1, center.y)]
-        Shape.__init__(self, coords, 'blue')
+        Shape.__init__(self, shape_points(0, center), 'blue')
         self.shift_rotation_dir = True
         self.center_block = self.blocks[2]
 
 
 class J_shape(Shape):
+    rotations = ROTATIONS[1]
+
     def __init__(self, center):
-        coords = [Point(center.x - 1, center.y),
-                  Point(center.x, center.y),
-                  Point(center.x + 1, center.y),
-                  Point(center.x + 1, center.y + 1)]
-        Shape.__init__(self, coords, 'orange')
+        Shape.__init__(self, shape_points(1, center), 'orange')
         self.center_block = self.blocks[1]
 
 
 class L_shape(Shape):
+    rotations = ROTATIONS[2]
+
     def __init__(self, center):
-        coords = [Point(center.x - 1, center.y),
-                  Point(center.x, center.y),
-                  Point(center.x + 1, center.y),
-                  Point(center.x - 1, center.y + 1)]
-        Shape.__init__(self, coords, 'cyan')
+        Shape.__init__(self, shape_points(2, center), 'cyan')
         self.center_block = self.blocks[1]
 
 
 class O_shape(Shape):
+    rotations = ROTATIONS[3]
+
     def __init__(self, center):
-        coords = [Point(center.x, center.y),
-                  Point(center.x - 1, center.y),
-                  Point(center.x, center.y + 1),
-                  Point(center.x - 1, center.y + 1)]
-        Shape.__init__(self, coords, 'red')
+        Shape.__init__(self, shape_points(3, center), 'red')
         self.center_block = self.blocks[0]
 
     def rotate(self, board):
@@ -243,34 +278,28 @@ class O_shape(Shape):
 
 
 class S_shape(Shape):
+    rotations = ROTATIONS[4]
+
     def __init__(self, center):
-        coords = [Point(center.x, center.y),
-                  Point(center.x, center.y + 1),
-                  Point(center.x + 1, center.y),
-                  Point(center.x - 1, center.y + 1)]
-        Shape.__init__(self, coords, 'green')
+        Shape.__init__(self, shape_points(4, center), 'green')
         self.center_block = self.blocks[0]
         self.shift_rotation_dir = True
         self.rotation_dir = -1
 
 
 class T_shape(Shape):
+    rotations = ROTATIONS[5]
+
     def __init__(self, center):
-        coords = [Point(center.x - 1, center.y),
-                  Point(center.x, center.y),
-                  Point(center.x + 1, center.y),
-                  Point(center.x, center.y + 1)]
-        Shape.__init__(self, coords, 'yellow')
+        Shape.__init__(self, shape_points(5, center), 'yellow')
         self.center_block = self.blocks[1]
 
 
 class Z_shape(Shape):
+    rotations = ROTATIONS[6]
+
     def __init__(self, center):
-        coords = [Point(center.x - 1, center.y),
-                  Point(center.x, center.y),
-                  Point(center.x, center.y + 1),
-                  Point(center.x + 1, center.y + 1)]
-        Shape.__init__(self, coords, 'magenta')
+        Shape.__init__(self, shape_points(6, center), 'magenta')
         self.center_block = self.blocks[1]
         self.shift_rotation_dir = True
         self.rotation_dir = -1
@@ -282,22 +311,27 @@ class Z_shape(Shape):
 
 class Board():
     ''' Board class: it represents the Tetris board
+        The rules are kept by a TetrisCore; the board draws its well.
 
         Attributes: width - type:int - width of the board in squares
                     height - type:int - height of the board in squares
+                    core - type:TetrisCore - the game the board shows
                     canvas - type:CanvasFrame - where the pieces will be drawn
-                    grid - type:Dictionary - keeps track of the current state of
-                    the board; stores the blocks for a given position
+                    grid - type:Dictionary - the blocks drawn for the
+                    squares taken in the well, by (x, y) position
     '''
 
-    def __init__(self, win, width, height):
+    def __init__(self, win, width, height, core=None):
         self.width = width
         self.height = height
+        self.core = core or TetrisCore(width, height)
 
         # create a canvas to draw the tetris shapes on
         self.canvas = CanvasFrame(win, self.width * Block.BLOCK_SIZE,
                                         self.height * Block.BLOCK_SIZE)
         self.canvas.setBackground('light gray')
+        # blocks of deleted rows are hidden and reused for new shapes
+        self.canvas.setPooling()
 
         # create an empty dictionary to hold shapes on the board
         self.grid = {}
@@ -321,20 +355,11 @@ class Board():
                         y - type:int
             Return value: type: bool
 
-            1. checks if it is ok to move to square x,y
-            if the position is outside of the board boundaries, can't move there
-            return False
-            2. If there is already a block at that postion, can't move there
-            return False
-            3. Returns True in all other cases
+            checks if it is ok to move to square x,y: the square must
+            be on the board and not taken in the core's well
         '''
 
-        if x not in range(Tetris.BOARD_WIDTH) or y not in range(Tetris.BOARD_HEIGHT):
-            return False
-        elif (x, y) in self.grid.keys():
-            return False
-        else:
-            return True
+        return self.core.is_free(x, y)
 
     def add_shape(self, shape):
         ''' Parameter: shape - type:Shape
@@ -362,7 +387,7 @@ class Board():
             handout
 
         '''
-        for x in range(10):
+        for x in range(self.width):
             self.grid[(x, y)].undraw()
             del self.grid[(x, y)]
 
@@ -370,52 +395,28 @@ class Board():
         ''' Parameter: y - type: int
             Return value: type: bool
 
-            for each block in row y
-            check if there is a block in the grid (use the in operator)
-            if there is one square that is not occupied, return False
-            otherwise return True
-
+            returns True if every square of row y is taken
         '''
-        for x in range(10):
-            if (x, y) not in self.grid.keys():
-                return False
-
-        return True
-
-    def move_down_rows(self, y_start):
-        ''' Parameters: y_start - type:int
+        return self.core.is_row_complete(y)
 
-            for each row from y_start to the top
-                for each column
-                    check if there is a block in the grid
-                    if there is, remove it from the grid
-                    and move the block object down on the screen
-                    and then place it back in the grid in the new position
-
-        '''
-        while y_start > 0:
-            for x in range(10):
-                if (x, y_start) in self.grid.keys():
-                    block = self.grid[(x, y_start)]
-                    del self.grid[(x, y_start)]
-                    block.move(0, 1)
-                    self.grid[(block.x, block.y)] = block
-
-            y_start -= 1
-
-    def remove_complete_rows(self):
-        ''' removes all the complete rows
-            1. for each row, y,
-            2. check if the row is complete
-                if it is,
-                    delete the row
-                    move all rows down starting at row y - 1
+    def remove_rows(self, rows):
+        ''' Parameters: rows - type:list - the rows the core cleared, in
+            the order it cleared them (see TetrisCore.cleared)
 
+            deletes the blocks of the rows, then moves every block above
+            them down once, by the number of cleared rows below it
         '''
-        for y in range(Tetris.BOARD_HEIGHT):
-            if self.is_row_complete(y):
-                self.delete_row(y)
-                self.move_down_rows(y)
+        if not rows:
+            return
+        for y in rows:
+            self.delete_row(y)
+        grid = {}
+        for (x, y), block in self.grid.items():
+            drop = len([row for row in rows if row > y])
+            if drop:
+                block.move(0, drop)
+            grid[(block.x, block.y)] = block
+        self.grid = grid
 
     def game_over(self):
         ''' display "Game Over !!!" message in the center of the board
@@ -434,16 +435,13 @@ class Board():
 
 
 class ScoreBoard():
-    ''' ScoreBoard class: Scores the game, keeps track of the level
+    ''' ScoreBoard class: Shows the score and the level of the game
 
         Attributes: width - type:int - width of the board in squares
                     height - type:int - height of the board in squares
                     canvas - type:CanvasFrame - where the pieces will be drawn
 
     '''
-    Level = 1
-    Level2 = 1
-    Display = 0
 
     def __init__(self, win, width, height):
         self.width = width
@@ -452,40 +450,23 @@ class ScoreBoard():
                                         self.height * Block.BLOCK_SIZE)
         self.canvas.setBackground('light gray')
         self.current_score = Text(Point(8 * Block.BLOCK_SIZE, self.height / 2 *
-                                                Block.BLOCK_SIZE), self.Display)
+                                                Block.BLOCK_SIZE), 0)
         self.current_score.setSize(25)
         self.current_score.draw(self.canvas)
         self.current_level = Text(Point(self.width / 4 * Block.BLOCK_SIZE,
                                         self.height / 2 * Block.BLOCK_SIZE),
-                                        "Level " + str(self.Level))
+                                        "Level 1")
         self.current_level.setSize(25)
         self.current_level.draw(self.canvas)
 
-    def update(self, score):
-
-        self.Display += score
-
-        self.current_score.setText(self.Display)
-        if 0 <= self.Display < 1000:
-            self.Level = 1
-        elif 1000 <= self.Display < 2000:
-            self.Level = 2
-        elif 2000 <= self.Display < 4000:
-            self.Level = 3
-        elif 4000 <= self.Display < 8000:
-            self.Level = 4
-        elif 8000 <= self.Display < 16000:
-            self.Level = 5
-        else:
-            self.Level = 6
-        self.current_level.setText("Level " + str(self.Level))
+    def update(self, score, level):
+        ''' Parameters: score - type:int
+                        level - type:int
 
-    def level_up(self):
-        if self.Level == self.Level2:
-            return False
-        else:
-            self.Level2 += 1
-            return True
+            shows the score and the level
+        '''
+        self.current_score.setText(score)
+        self.current_level.setText("Level " + str(level))
 
 ############################################################
 # SPIECE PREVIEW CLASS
@@ -508,19 +489,22 @@ class PiecePreview():
         self.canvas = CanvasFrame(win, self.width * Block.BLOCK_SIZE,
                                         self.height * Block.BLOCK_SIZE)
         self.canvas.setBackground('light gray')
+        self.canvas.setPooling()
 
     def draw_shape(self, n):
         ''' Parameters: shape - type: Shape
             draws the preview piece on the board
         '''
         self.preview = Tetris.SHAPES[n](Point(int(Tetris.BOARD_WIDTH / 2), 0.5))
-        self.preview.draw(self.canvas)
+        with self.canvas.batch():
+            self.preview.draw(self.canvas)
 
     def remove_shape(self):
         ''' Removes the current piece preview
 
         '''
-        Shape.undraw(self.preview)
+        with self.canvas.batch():
+            Shape.undraw(self.preview)
 
 
 ############################################################
@@ -529,15 +513,22 @@ class PiecePreview():
 
 class Tetris(object):
     ''' Tetris class: Controls the game play
+        The rules are played by a TetrisCore; the Tetris object passes
+        it the keys and timer ticks and keeps the board, the preview and
+        the score board in step with it.
         Attributes:
             SHAPES - type: list (list of Shape classes)
             DIRECTION - type: dictionary - converts string direction to (dx, dy)
             BOARD_WIDTH - type:int - the width of the board
             BOARD_HEIGHT - type:int - the height of the board
+            core - type:TetrisCore - the game being played
             board - type:Board - the tetris board
             win - type:Window - the window for the tetris game
             delay - type:int - the speed in milliseconds for moving the shapes
             current_shape - type: Shape - the current moving shape on the board
+            animate - type:bool - whether a timer drops the shapes; without
+            it the shapes only move on keys and drop_shape calls, which
+            is how tetris_sim plays games headless
     '''
 
     SHAPES = [I_shape, J_shape, L_shape, O_shape, S_shape, T_shape, Z_shape]
@@ -545,62 +536,82 @@ class Tetris(object):
     BOARD_WIDTH = 10
     BOARD_HEIGHT = 20
 
-    def __init__(self, win):
+    def __init__(self, win, animate=True, rng=None):
+        ''' rng picks the shapes, see TetrisCore
+        '''
 
+        self.core = TetrisCore(self.BOARD_WIDTH, self.BOARD_HEIGHT, rng)
+        self.animate = animate
         self.score = ScoreBoard(win, self.BOARD_WIDTH, 2)
         self.piece = PiecePreview(win, self.BOARD_WIDTH, 3)
-        self.board = Board(win, self.BOARD_WIDTH, self.BOARD_HEIGHT)
+        self.board = Board(win, self.BOARD_WIDTH, self.BOARD_HEIGHT, self.core)
 
         self.win = win
         self.delay = 1000  # ms
+        self.scheduler = Scheduler(win, self.drop_shape, self.delay)
         self.key = 0
         # sets up the keyboard events
         # when a key is called the method key_pressed will be called
         self.win.bind_all('<Key>', self.key_pressed)
 
-        # set the current shape to a random new shape
-        self.current_shape = self.create_new_shape()
+        # the core has picked the current and the next shape
+        self.current_shape = self.create_new_shape(self.core.kind)
 
         # Draw the current_shape on the board (take a look at the
         # draw_shape method in the Board class)
         self.board.draw_shape(self.current_shape)
-        self.new = self.create_new_shape()
+        self.new = self.create_new_shape(self.core.next_kind)
         PiecePreview.draw_shape(self.piece, self.random_number)
         #  animate the shape!
         self.animate_shape()
 
-    def create_new_shape(self):
-        ''' Return value: type: Shape
+    def create_new_shape(self, kind):
+        ''' Parameters: kind - type:int - index of the shape in SHAPES
+            Return value: type: Shape
 
-            Create a random new shape that is centered
+            Create a new shape of the kind the core picked, centered
              at y = 0 and x = int(self.BOARD_WIDTH/2)
             return the shape
         '''
-        self.random_number = random.randint(0, 6)
+        self.random_number = kind
         self.new_shape = self.SHAPES[self.random_number](Point(int
                                         (self.BOARD_WIDTH / 2), 0))
         return self.new_shape
 
     def animate_shape(self):
         ''' animate the shape - move down at equal intervals
-            specified by the delay attribute
+            specified by the delay attribute. The scheduler keeps
+            absolute deadlines, so the time a move takes does not
+            add to the interval. Does nothing when the game is not
+            animated
         '''
-        if (self.key == 'p' or self.key == 'P') and self.timestop != self.delay:
+        self.scheduler.setPeriod(self.delay)
+        if self.animate:
+            self.scheduler.start()
+
+    def drop_shape(self):
+        ''' moves the shape down one square; called by the scheduler
+            every delay ms. Stops the scheduler when paused or once the
+            game is over. The canvas changes of the move, including
+            removed rows and the new shape, are drawn in one batch
+        '''
+        if self.delay == 100000 or self.core.over:
+            self.scheduler.stop()
             return
-        if self.current_shape.can_move(self.board, 0, 0):
+        with self.board.canvas.batch():
             self.do_move('Down')
-            self.win.after(self.delay, self.animate_shape)
 
     def do_move(self, direction):
         ''' Parameters: direction - type: string
             Return value: type: bool
 
             Move the current shape in the direction specified by the parameter:
-            First check if the shape can move. If it can, move it and return
-            True Otherwise if the direction we tried to move was 'Down',
-            add the current shape to the board, scores completed rows
-            checks if level up, remove the completed rows if any,
-            create a new random shape and sets current_shape attribute
+            First ask the core to move the piece. If it can, move the shape
+            and return True Otherwise if the direction we tried to move was
+            'Down', the core locks and scores the piece and clears the
+            completed rows; add the shape to the board, remove the cleared
+            rows, update the score board and the delay if it leveled up and
+            make the next shape the current_shape
             3. If the shape cannot be drawn on the board, displays a
                game over message
 
@@ -608,36 +619,29 @@ class Tetris(object):
 
         (dx, dy) = self.DIRECTION[direction]
 
-        if self.current_shape.can_move(self.board, dx, dy):
+        if self.core.move(dx, dy):
             self.current_shape.move(dx, dy)
             return True
 
-        if self.current_shape.can_move(self.board, dx,
-                     dy) == False and (dx, dy) == (0, 1):
-            Board.add_shape(self.board, self.current_shape)
-            PiecePreview.remove_shape(self.piece)
-            scored1 = 5 * ScoreBoard.Level
-            ScoreBoard.update(self.score, scored1)
-            mult = 0
-            for y in range(self.BOARD_HEIGHT):
-                if Board.is_row_complete(self.board, y) == True:
-                    mult += 2
-            if mult > 0:
-                scored = 10 * mult * ScoreBoard.Level * mult
-            elif mult >= 8:
-                scored = 1000 * ScoreBoard.Level
-            else:
-                scored = 0
-            ScoreBoard.update(self.score, scored)
-            if ScoreBoard.level_up(self.score) == True:
-                self.delay -= 120
-            Board.remove_complete_rows(self.board)
-            self.current_shape = self.new
-            self.board.draw_shape(self.current_shape)
-            self.new = self.create_new_shape()
-            PiecePreview.draw_shape(self.piece, self.random_number)
-            return True
-        return False
+        if (dx, dy) != (0, 1) or self.core.over:
+            return False
+
+        # the piece landed: the core locks it, scores it and clears the
+        # complete rows; the views follow
+        core = self.core
+        core.lock()
+        Board.add_shape(self.board, self.current_shape)
+        PiecePreview.remove_shape(self.piece)
+        self.score.update(core.score, core.level)
+        if core.leveled_up:
+            self.delay = core.delay
+            self.scheduler.setPeriod(self.delay)
+        self.board.remove_rows(core.cleared)
+        self.current_shape = self.new
+        self.board.draw_shape(self.current_shape)
+        self.new = self.create_new_shape(core.next_kind)
+        PiecePreview.draw_shape(self.piece, self.random_number)
+        return True
 
     def do_rotate(self):
         ''' Checks if the current_shape can be rotated and
@@ -645,8 +649,9 @@ class Tetris(object):
         '''
         if self.delay == 100000:
             return
-        if self.current_shape.can_rotate(self.board):
-            self.current_shape.rotate(self.board)
+        if self.core.rotate():
+            self.current_shape.place(self.core.cells())
+            self.current_shape.set_rotation_state(self.core.state)
 
     def key_pressed(self, event):
         ''' when a key is pressed on the keyboard the current_shape will move in
@@ -655,20 +660,26 @@ class Tetris(object):
             down until it can no longer move and is added to the board
             if the user presses the 'Up' arrow key
                 the shape rotates.
+            The canvas changes of a key press are drawn in one batch, so
+            the moves of a hard drop are merged into a single move of
+            each block
         '''
 
         self.key = event.keysym
         if self.key in self.DIRECTION:
             if self.delay == 100000:
                 return
-            return self.do_move(self.key)
+            with self.board.canvas.batch():
+                return self.do_move(self.key)
         elif self.key == 'space':
             if self.delay == 100000:
                 return
-            while self.current_shape.can_move(self.board, 0, 1):
-                self.do_move('Down')
+            with self.board.canvas.batch():
+                while self.core.can_move(0, 1) and not self.core.over:
+                    self.do_move('Down')
         elif self.key == 'Up':
-            self.do_rotate()
+            with self.board.canvas.batch():
+                self.do_rotate()
         elif self.key == 'p' or self.key == 'P':
             if self.delay == 100000 and (self.key == 'p' or self.key == 'P'):
                 self.delay = self.timestop
@@ -677,11 +688,13 @@ class Tetris(object):
             else:
                 self.timestop = self.delay
                 self.delay = 100000
+                self.scheduler.stop()
 
 ################################################################
 # Start the game
 ################################################################
 
-win = Window("Tetris")
-game = Tetris(win)
-win.mainloop()
+if __name__ == '__main__':
+    win = Window("Tetris")
+    game = Tetris(win)
+    win.mainloop()
@@ -0,0 +1,382 @@
+'''
+Rendering-free rules of Tetris.
+
+TetrisCore owns the state of a game: the well, the falling piece, the
+next piece, the score and the level. tetris.Tetris is only a view over
+it: it asks the core to move, rotate and lock pieces and draws the
+result, so games can be played, replayed and searched without Tk.
+
+The well is a list of integers, one bitmask per row with bit x + 4 set
+when square x is taken and a wall of set bits around the board. A piece
+is a bitmask for each of its rows, so a collision test is one AND per
+piece row, a full row is one that equals the full mask and clearing a
+row is deleting it from the list. Rotations are looked up in tables
+built at import (see ROTATIONS):
+
+    core = TetrisCore()
+    while not core.over:
+        core.hard_drop()
+'''
+
+import bisect
+import random
+
+BOARD_WIDTH = 10
+BOARD_HEIGHT = 20
+
+# name, (dx, dy) of the squares from the spawn point, first rotation
+# direction (0: the shape does not rotate) and whether the direction
+# flips after every rotation. Pieces rotate around their second square.
+SHAPES = (
+    ('I', ((-2, 0), (-1, 0), (0, 0), (1, 0)), 1, True),
+    ('J', ((-1, 0), (0, 0), (1, 0), (1, 1)), 1, False),
+    ('L', ((-1, 0), (0, 0), (1, 0), (-1, 1)), 1, False),
+    ('O', ((0, 0), (-1, 0), (0, 1), (-1, 1)), 0, False),
+    ('S', ((0, 0), (0, 1), (1, 0), (-1, 1)), -1, True),
+    ('T', ((-1, 0), (0, 0), (1, 0), (0, 1)), 1, False),
+    ('Z', ((-1, 0), (0, 0), (0, 1), (1, 1)), -1, True),
+)
+
+# scores at which levels 2, 3, ... start
+LEVEL_SCORES = (1000, 2000, 4000, 8000, 16000)
+
+# a rotation moves a square at most this far from the centre, so this
+# much wall around the board keeps every square a rotation can produce
+# inside the well
+_PAD = 4
+
+
+def rotate_coords(coords, rotation_dir):
+    ''' Parameters: coords - list of (x, y) squares of a piece
+                    rotation_dir - type:int - 1 or -1
+
+        Returns the squares after a quarter turn around the second square.
+    '''
+    cx, cy = coords[1]
+    return [(cx - rotation_dir * cy + rotation_dir * y,
+             cy + rotation_dir * cx - rotation_dir * x) for x, y in coords]
+
+
+def _normalize(cells):
+    ''' Returns the top left of cells and the (dx, dy) of every square
+        from it.
+    '''
+    x = min([cx for cx, cy in cells])
+    y = min([cy for cx, cy in cells])
+    return (x, y), tuple([(cx - x, cy - y) for cx, cy in cells])
+
+
+def _row_masks(offsets):
+    ''' Returns a (dy, mask) pair for every row of a piece, top to
+        bottom, with bit dx set for each of its squares.
+    '''
+    masks = {}
+    for dx, dy in offsets:
+        masks[dy] = masks.get(dy, 0) | 1 << dx
+    return tuple(sorted(masks.items()))
+
+
+def _rotation_states(shape):
+    ''' Parameters: shape - an entry of SHAPES
+
+        Rotates the shape the way the game does until it comes back to
+        its spawn state and returns the tuple of its rotation states.
+    '''
+    name, cells, rotation_dir, flips = shape
+    corner, offsets = _normalize(cells)
+    states = []
+    while True:
+        if not rotation_dir:
+            states.append((offsets, _row_masks(offsets), 0, None))
+            return tuple(states)
+        new_corner, new_offsets = _normalize(rotate_coords(cells,
+                                                           rotation_dir))
+        shift = (new_corner[0] - corner[0], new_corner[1] - corner[1])
+        states.append((offsets, _row_masks(offsets), rotation_dir, shift))
+        cells = rotate_coords(cells, rotation_dir)
+        corner, offsets = new_corner, new_offsets
+        if flips:
+            rotation_dir = -rotation_dir
+        if (offsets, rotation_dir) == (states[0][0], states[0][2]):
+            return tuple(states)
+
+
+# ROTATIONS[kind] is the tuple of rotation states of a shape, in the
+# order the game rotates through them, starting with the spawn state.
+# A state is (offsets, masks, rotation_dir, shift): the (dx, dy) of the
+# squares from the top left in the order of the shape's squares, their
+# row masks (see _row_masks), the direction the next rotation turns and
+# how far the top left moves on that rotation (None if it does not
+# rotate).
+ROTATIONS = tuple([_rotation_states(shape) for shape in SHAPES])
+
+# moves of the rotated piece tried in turn when kicks are on, in case it
+# does not fit where it turned: into the walls and up off the floor
+KICKS = tuple([((0, 0), (-1, 0), (1, 0), (-2, 0), (2, 0), (0, -1))
+               if name == 'I' else ((0, 0), (-1, 0), (1, 0), (0, -1))
+               for name, cells, rotation_dir, flips in SHAPES])
+_NO_KICKS = ((0, 0),)
+
+
+class TetrisCore(object):
+    ''' TetrisCore class: the state and rules of a game of Tetris
+        Attributes: width - type:int - width of the well in squares
+                    height - type:int - height of the well in squares
+                    rows - type:list - bitmask of every row of the well,
+                    walls included; row y is rows[y + 4] and square x is
+                    bit x + 4
+                    full - type:int - the mask of a full row
+                    kind - type:int - index in SHAPES of the falling piece
+                    x, y - type:int - top left of the falling piece
+                    offsets - type:tuple - (dx, dy) of its squares from
+                    x, y, in the order of the shape's squares
+                    state - type:int - its index in ROTATIONS[kind]
+                    rotation_dir - type:int - its next rotation direction
+                    kicks - type:bool - whether a rotation that does not
+                    fit tries the moves in KICKS
+                    next_kind - type:int - index in SHAPES of the next piece
+                    score - type:int
+                    level - type:int
+                    delay - type:int - ms between drops at this level
+                    lines - type:int - number of rows cleared
+                    pieces - type:int - number of pieces locked
+                    cleared - type:list - the rows cleared by the last lock,
+                    in the order they were removed
+                    leveled_up - type:bool - whether the last lock went up
+                    a level
+                    over - type:bool - True once a new piece does not fit
+    '''
+
+    def __init__(self, width=BOARD_WIDTH, height=BOARD_HEIGHT, rng=None,
+                 kicks=False):
+        ''' rng is anything with a randint method, by default the random
+            module, so random.seed() replays a game. The original game
+            has no wall kicks, so they are off by default.
+        '''
+        self.width = width
+        self.height = height
+        self.rng = rng or random
+        self.kicks = kicks
+        self.full = (1 << (width + 2 * _PAD)) - 1
+        self._empty_row = self.full ^ (((1 << width) - 1) << _PAD)
+        self.rows = ([self.full] * _PAD + [self._empty_row] * height
+                     + [self.full] * _PAD)
+        self.score = 0
+        self.level = 1
+        self._levels_shown = 1
+        self.delay = 1000
+        self.lines = 0
+        self.pieces = 0
+        self.cleared = []
+        self.leveled_up = False
+        self.over = False
+        self.kind = self._random_kind()
+        self._spawn(self.kind)
+        self.next_kind = self._random_kind()
+
+    def _random_kind(self):
+        return self.rng.randint(0, len(SHAPES) - 1)
+
+    def _spawn(self, kind):
+        cells = SHAPES[kind][1]
+        self.kind = kind
+        self.state = 0
+        self.offsets, self._masks, self.rotation_dir, shift = ROTATIONS[kind][0]
+        self.x = self.width // 2 + min([dx for dx, dy in cells])
+        self.y = min([dy for dx, dy in cells])
+        if not self.fits(self.piece()):
+            self.over = True
+
+    ####################################
+    # SQUARES
+    ####################################
+
+    def piece_at(self, cells):
+        ''' Parameters: cells - list of (x, y) squares, in the order of
+                            the shape's squares
+
+            Returns the piece on those squares as a tuple (x, y, offsets,
+            masks): its top left, the offsets of its squares from there
+            and a (dy, mask) pair for each of its rows, top to bottom,
+            with bit dx set for every square.
+        '''
+        (x, y), offsets = _normalize(cells)
+        return x, y, offsets, _row_masks(offsets)
+
+    def piece(self):
+        ''' Returns the falling piece as a tuple like piece_at.
+        '''
+        return self.x, self.y, self.offsets, self._masks
+
+    def _place(self, piece):
+        self.x, self.y, self.offsets, self._masks = piece
+
+    def cells(self):
+        ''' Returns the list of (x, y) squares of the falling piece, in
+            the order of the shape's squares.
+        '''
+        x = self.x
+        y = self.y
+        return [(x + dx, y + dy) for dx, dy in self.offsets]
+
+    def is_free(self, x, y):
+        ''' Returns True if (x, y) is on the board and empty.
+        '''
+        return (0 <= x < self.width and 0 <= y < self.height
+                and not self.rows[y + _PAD] >> (x + _PAD) & 1)
+
+    def is_row_complete(self, y):
+        ''' Returns True if every square of row y is taken.
+        '''
+        return self.rows[y + _PAD] == self.full
+
+    def fits(self, piece):
+        ''' Returns True if all the squares of piece, a tuple like
+            piece_at returns, are empty.
+        '''
+        x, y, offsets, masks = piece
+        rows = self.rows
+        x += _PAD
+        y += _PAD
+        for dy, mask in masks:
+            if rows[y + dy] & mask << x:
+                return False
+        return True
+
+    ####################################
+    # MOVES
+    ####################################
+
+    def can_move(self, dx, dy):
+        ''' Returns True if the falling piece can move dx, dy squares.
+        '''
+        rows = self.rows
+        x = self.x + dx + _PAD
+        y = self.y + dy + _PAD
+        for row, mask in self._masks:
+            if rows[y + row] & mask << x:
+                return False
+        return True
+
+    def move(self, dx, dy):
+        ''' Moves the falling piece dx, dy squares if it can and returns
+            True, otherwise returns False. Does nothing once the game is
+            over.
+        '''
+        if self.over:
+            return False
+        rows = self.rows
+        x = self.x + dx + _PAD
+        y = self.y + dy + _PAD
+        for row, mask in self._masks:
+            if rows[y + row] & mask << x:
+                return False
+        self.x += dx
+        self.y += dy
+        return True
+
+    def rotated(self):
+        ''' Returns the piece after a rotation, before any kick, or None
+            for shapes that do not rotate.
+        '''
+        states = ROTATIONS[self.kind]
+        shift = states[self.state][3]
+        if shift is None:
+            return None
+        offsets, masks = states[(self.state + 1) % len(states)][:2]
+        return self.x + shift[0], self.y + shift[1], offsets, masks
+
+    def rotate(self):
+        ''' Rotates the falling piece if it can and returns True,
+            otherwise returns False. With kicks on, a piece that does not
+            fit where it turned tries the moves in KICKS.
+        '''
+        if self.over:
+            return False
+        states = ROTATIONS[self.kind]
+        shift = states[self.state][3]
+        if shift is None:
+            return False
+        state = (self.state + 1) % len(states)
+        offsets, masks, rotation_dir = states[state][:3]
+        rows = self.rows
+        x = self.x + shift[0]
+        y = self.y + shift[1]
+        for kx, ky in KICKS[self.kind] if self.kicks else _NO_KICKS:
+            for row, mask in masks:
+                if rows[y + ky + row + _PAD] & mask << (x + kx + _PAD):
+                    break
+            else:
+                self.x = x + kx
+                self.y = y + ky
+                self.offsets = offsets
+                self._masks = masks
+                self.state = state
+                self.rotation_dir = rotation_dir
+                return True
+        return False
+
+    def drop_distance(self):
+        ''' Returns how far the falling piece can move down.
+        '''
+        rows = self.rows
+        x = self.x + _PAD
+        y = self.y + _PAD + 1
+        masks = [(y + row, mask << x) for row, mask in self._masks]
+        distance = 0
+        while True:
+            for row, mask in masks:
+                if rows[row + distance] & mask:
+                    return distance
+            distance += 1
+
+    def hard_drop(self):
+        ''' Moves the falling piece down as far as it goes and locks it.
+            Returns the list of rows cleared.
+        '''
+        if self.over:
+            return []
+        self.y += self.drop_distance()
+        return self.lock()
+
+    ####################################
+    # LOCKING
+    ####################################
+
+    def lock(self):
+        ''' Adds the falling piece to the well where it is, scores it,
+            clears the complete rows and brings in the next piece.
+            Returns the list of rows cleared (also kept in cleared).
+        '''
+        rows = self.rows
+        x = self.x + _PAD
+        y = self.y + _PAD
+        full = self.full
+        self.cleared = []
+        for row, mask in self._masks:
+            rows[y + row] |= mask << x
+            if rows[y + row] == full:
+                self.cleared.append(self.y + row)
+        self.pieces += 1
+
+        # the masks go top to bottom, so removing a row leaves the
+        # indexes of the rows below it alone
+        for row in self.cleared:
+            del rows[row + _PAD]
+            rows.insert(_PAD, self._empty_row)
+        self.lines += len(self.cleared)
+
+        # 5 for every piece and 40 * n * n for n rows; the original game
+        # never scaled the score by the level
+        self.score += 5 + 40 * len(self.cleared) ** 2
+        self.level = 1 + bisect.bisect_right(LEVEL_SCORES, self.score)
+        # the drop speeds up by one step per lock while the shown level
+        # lags behind the level of the score
+        self.leveled_up = self.level != self._levels_shown
+        if self.leveled_up:
+            self._levels_shown += 1
+            self.delay -= 120
+
+        self._spawn(self.next_kind)
+        self.next_kind = self._random_kind()
+        return self.cleared
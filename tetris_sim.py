@@ -0,0 +1,207 @@
+'''
+Headless batch runs of Tetris.
+
+Plays whole games of tetris.Tetris without a window or a timer: the
+game is drawn with the headless graphics backend and is not animated,
+so the shapes only move on the keys fed to it. A key is one of the
+names key_pressed takes ('Left', 'Right', 'Down', 'Up', 'space') or
+'tick', which drops the shape one square as the timer would:
+
+    python tetris_sim.py --games 1000 --output sim.json
+
+Keys come from a player: a function that is called with the game
+before every key and returns the next key, or None to stop the game.
+random_player presses random keys, tetris_ai.ai_player plays the
+placements of the search AI and script_player replays a list of keys,
+so scoring and leveling can be checked against known games:
+
+    result = play_game(script_player(['space', 'tick'] * 30), seed=4)
+
+The report gives every game's score, level, lines and pieces and the
+games and keys per second of the whole run. A seed replays the same
+game on the same major version of Python; Python 2 and 3 pick
+different random numbers.
+'''
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+# never open a window, even when a display is available
+os.environ.setdefault('GRAPHICS_BACKEND', 'null')
+
+from graphics import Window
+from tetris import Tetris
+
+
+KEYS = ['Left', 'Right', 'Down', 'Up', 'space', 'tick']
+
+
+class KeyEvent(object):
+    ''' KeyEvent class: the part of a Tk key event that key_pressed uses
+        Attributes: keysym - type:string - the name of the key
+    '''
+
+    def __init__(self, keysym):
+        self.keysym = keysym
+
+
+############################################################
+# PLAYERS
+############################################################
+
+
+def random_player(rng=None, keys=KEYS):
+    ''' Parameters: rng - type:random.Random - picks the keys (default: the
+                    random module)
+                    keys - type:list - the keys to pick from
+
+        Returns a player that presses random keys until the game is over.
+    '''
+    rng = rng or random
+
+    def player(game):
+        return rng.choice(keys)
+    return player
+
+
+def script_player(keys):
+    ''' Parameters: keys - a list or string of keys, a string being split
+                    on commas and whitespace
+
+        Returns a player that presses the keys in turn and stops the game
+        after the last one.
+    '''
+    if isinstance(keys, str):
+        keys = keys.replace(',', ' ').split()
+    keys = iter(keys)
+
+    def player(game):
+        return next(keys, None)
+    return player
+
+
+############################################################
+# RUNNING
+############################################################
+
+
+def git_commit():
+    ''' Returns the current git commit, or None outside of a git checkout.
+    '''
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                         stderr=subprocess.STDOUT,
+                                         cwd=os.path.dirname(os.path.abspath(__file__)))
+        return output.decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def play_game(player, seed=None, max_keys=None):
+    ''' Parameters: player - a function of the game that returns the next
+                    key, or None to stop
+                    seed - type:int - seed for the shapes (default: random)
+                    max_keys - type:int - stop after this many keys
+
+        Plays one headless game and returns a dictionary of its results.
+        The game ends when it is over, when the player stops or after
+        max_keys keys.
+    '''
+    game = Tetris(Window('tetris'), animate=False, rng=random.Random(seed))
+    core = game.core
+    keys = 0
+    while not core.over and (max_keys is None or keys < max_keys):
+        key = player(game)
+        if key is None:
+            break
+        if key == 'tick':
+            game.drop_shape()
+        else:
+            game.key_pressed(KeyEvent(key))
+        keys += 1
+    game.win.destroy()
+    return {
+        'seed': seed,
+        'keys': keys,
+        'over': core.over,
+        'score': core.score,
+        'level': core.level,
+        'delay': game.delay,
+        'lines': core.lines,
+        'pieces': core.pieces,
+    }
+
+
+def run(games, seed, max_keys, script=None, player_name='random'):
+    ''' Plays games headless games, the i-th with shapes seeded by seed + i,
+        and returns the report as a dictionary. The keys come from the
+        script if there is one, otherwise from the player named by
+        player_name: 'random' (random keys, seeded by the same seed) or
+        'ai' (tetris_ai.TetrisAI).
+    '''
+    if player_name == 'ai' and script is None:
+        # NumPy is only needed for the AI
+        from tetris_ai import ai_player
+    results = []
+    keys = 0
+    start = time.time()
+    for i in range(games):
+        if script is not None:
+            player = script_player(script)
+        elif player_name == 'ai':
+            player = ai_player()
+        else:
+            player = random_player(random.Random(-1 - seed - i))
+        result = play_game(player, seed + i, max_keys)
+        keys += result['keys']
+        results.append(result)
+    seconds = time.time() - start
+    return {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'settings': {'games': games, 'seed': seed, 'max_keys': max_keys,
+                     'script': script, 'player': player_name},
+        'seconds': seconds,
+        'games_per_sec': games / seconds if seconds else None,
+        'keys_per_sec': keys / seconds if seconds else None,
+        'results': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Play headless games of Tetris.')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=1,
+                        help='seed of the first game')
+    parser.add_argument('--max-keys', type=int, default=10000,
+                        help='keys after which a game stops')
+    parser.add_argument('--script',
+                        help="keys to play in every game, e.g. 'Left Up space' "
+                             "(default: keys from --player)")
+    parser.add_argument('--player', choices=['random', 'ai'], default='random',
+                        help='where the keys come from without a script')
+    parser.add_argument('--output', help='file for the JSON report (default: stdout)')
+    args = parser.parse_args(argv)
+
+    report = run(args.games, args.seed, args.max_keys, args.script, args.player)
+    sys.stderr.write('%d games in %.2f s: %.1f games/s, %.0f keys/s\n'
+                     % (args.games, report['seconds'],
+                        report['games_per_sec'] or 0, report['keys_per_sec'] or 0))
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()